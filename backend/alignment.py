@@ -0,0 +1,114 @@
+import os
+import numpy as np
+
+# --- WALK-FORWARD ALIGNMENT ---
+# Keeps each day's 2D map in the same orientation as the days before it, so
+# the timeline animates motion rather than arbitrary UMAP rotations.
+#
+# Tickers get a stable integer row the first time they appear; every frame
+# is then just (row ids, coords) and all matching is array indexing. Each
+# new frame is fit with a weighted orthogonal Procrustes (rotation +
+# translation) over every ticker it shares with the reference, with anchors
+# up-weighted. By default the reference is the previous aligned frame; set
+# ALIGN_REFERENCE_FRAMES above 1 (e.g. 5) to align to an exponentially
+# weighted average of that many frames, so one noisy day cannot re-orient
+# everything after it.
+
+ALIGN_ANCHOR_WEIGHT = float(os.getenv("ALIGN_ANCHOR_WEIGHT", "10"))
+ALIGN_REFERENCE_FRAMES = int(os.getenv("ALIGN_REFERENCE_FRAMES", "1"))   # 1 = previous frame only
+ALIGN_REFERENCE_DECAY = float(os.getenv("ALIGN_REFERENCE_DECAY", "0.5"))  # weight of frame k back = decay**k
+ALIGN_MIN_SHARED = 3
+
+
+def weighted_procrustes(source, target, weights):
+    """
+    Rotation R and centroids (c_src, c_tgt) minimizing
+    sum_i w_i * ||(target_i - c_tgt) R + c_src - source_i||^2, reflections excluded.
+    Apply with (points - c_tgt) @ R + c_src.
+    """
+    w = weights / weights.sum()
+    c_src = w @ source
+    c_tgt = w @ target
+    H = (target - c_tgt).T @ ((source - c_src) * w[:, None])
+    U, _, Vt = np.linalg.svd(H)
+    # Flip the last axis if the best fit is a mirror image.
+    d = np.sign(np.linalg.det(U @ Vt)) or 1.0
+    R = (U * np.r_[np.ones(len(H) - 1), d]) @ Vt
+    return R, c_src, c_tgt
+
+
+class FrameAligner:
+    def __init__(self, anchor_tickers=(), anchor_weight=ALIGN_ANCHOR_WEIGHT,
+                 reference_frames=ALIGN_REFERENCE_FRAMES, decay=ALIGN_REFERENCE_DECAY):
+        self.index = {}
+        self.tickers = []
+        self.anchor_tickers = set(anchor_tickers)
+        self.anchor_weight = anchor_weight
+        self.reference_frames = max(1, reference_frames)
+        self.decay = decay
+        self.is_anchor = np.zeros(0, dtype=bool)
+        self.frames = []  # newest last: (row ids, aligned coords)
+        self._reference = None
+
+    def rows_for(self, tickers):
+        """Stable row id per ticker, assigning new ids on first sight."""
+        index = self.index
+        rows = np.fromiter((index.setdefault(t, len(index)) for t in tickers), dtype=np.int64, count=len(tickers))
+        if len(index) > len(self.tickers):
+            new = [t for t in tickers if index[t] >= len(self.tickers)]
+            new.sort(key=index.get)
+            self.tickers.extend(new)
+            self.is_anchor = np.concatenate([self.is_anchor, [t in self.anchor_tickers for t in new]])
+        return rows
+
+    def reference(self):
+        """(positions, mass) over all known rows; mass is the EW weight of frames containing each row."""
+        n = len(self.index)
+        if self._reference is not None and len(self._reference[1]) == n:
+            return self._reference
+        acc = np.zeros((n, 2))
+        mass = np.zeros(n)
+        for age, (rows, coords) in enumerate(reversed(self.frames)):
+            w = self.decay ** age
+            acc[rows] += w * coords
+            mass[rows] += w
+        seen = mass > 0
+        acc[seen] /= mass[seen, None]
+        self._reference = (acc, mass)
+        return acc, mass
+
+    def initial_positions(self, tickers, rng=np.random):
+        """
+        UMAP init for today's tickers: their reference position, or the
+        reference centroid plus a little jitter for tickers not seen yet.
+        Returns None before the first frame.
+        """
+        if not self.frames: return None
+        rows = self.rows_for(tickers)
+        positions, mass = self.reference()
+        pos, known = positions[rows], mass[rows] > 0
+        centroid = positions[mass > 0].mean(axis=0)
+        pos[~known] = centroid + rng.normal(0, 1, (int((~known).sum()), 2))
+        return pos.astype(np.float32)
+
+    def align(self, tickers, coords):
+        """Aligns a frame to the reference, stores it, and returns the aligned coords."""
+        rows = self.rows_for(tickers)
+        coords = np.asarray(coords, dtype=np.float64)
+        aligned = coords
+
+        if self.frames:
+            positions, mass = self.reference()
+            shared = mass[rows] > 0
+            if shared.sum() >= ALIGN_MIN_SHARED:
+                shared_rows = rows[shared]
+                # Trust tickers present in more (and more recent) reference frames.
+                weights = mass[shared_rows] * np.where(self.is_anchor[shared_rows], self.anchor_weight, 1.0)
+                R, c_src, c_tgt = weighted_procrustes(positions[shared_rows], coords[shared], weights)
+                aligned = (coords - c_tgt) @ R + c_src
+
+        self.frames.append((rows, aligned))
+        self._reference = None
+        if len(self.frames) > self.reference_frames:
+            self.frames.pop(0)
+        return aligned
@@ -1,29 +1,28 @@
 import os
-import requests
 import time
 import concurrent.futures
 from datetime import datetime
-from dotenv import load_dotenv
-from supabase import create_client, Client
-from openai import OpenAI
 from tenacity import retry, wait_random_exponential, stop_after_attempt
+import config  # noqa: F401
+from metrics import run_metrics
+from rate_limiter import polygon_get
+from http_client import get_http_client
+from clients import get_openai, get_db_writer, close_clients
+from batch_writer import AdaptiveBatchWriter, NewsGraphWriter
+from dedup import DedupIndex, dedupe_articles, duplicate_edges, DUPLICATE_EDGE_TYPE
+from similarity import SimilarityLinker
 
 # --- BACKFILL ORCHESTRATOR ---
 # Bulk processor for historical OHLC data and news archives.
 # Populates the initial database state for the targeted regime.
 
-load_dotenv()
 MASSIVE_KEY = os.getenv("MASSIVE_API_KEY")
 POLYGON_BASE_URL = "https://api.polygon.io" 
 
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-supabase: Client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
-
 # Configuration
 START_DATE = "2025-10-15"
 END_DATE = datetime.now().strftime('%Y-%m-%d')
 MAX_WORKERS = 20 
-DB_BATCH_SIZE = 200
 
 # Market Universe (S&P 500 + Core High Beta/AI/Crypto)
 ANCHOR_TICKERS = [
@@ -102,68 +101,24 @@ TICKER_UNIVERSE = list(set(MANUAL_TICKERS + ANCHOR_TICKERS))
 
 # --- ROBUST UTILS ---
 
-@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6),
+       before=run_metrics.tenacity_hook("get_embedding"))
 def get_embedding(text):
     text = text.replace("\n", " ")
-    return openai_client.embeddings.create(input=[text], model="text-embedding-3-small").data[0].embedding
-
-def upload_stock_batch(records):
-    if not records: return
-    try:
-        supabase.table("stocks_ohlc").upsert(
-            records, 
-            on_conflict="ticker,date", 
-            ignore_duplicates=True
-        ).execute()
-        print(f" 💾 Saved {len(records)} rows to DB.")
-    except Exception as e:
-        print(f" ❌ DB Error (Batch Skipped): {str(e)[:100]}...")
-
-def upload_news_batch(vectors, edges):
-    if not vectors: return
-    try:
-        # Upload vectors
-        res = supabase.table("news_vectors").upsert(
-            vectors, 
-            on_conflict="url"
-        ).execute()
-        
-        # Map new IDs to edges
-        if res.data:
-            url_to_id = {item['url']: item['id'] for item in res.data}
-            
-            final_edges = []
-            for edge_stub in edges:
-                article_id = url_to_id.get(edge_stub['source_url'])
-                if article_id:
-                    final_edges.append({
-                        "source_node": str(article_id),
-                        "target_node": edge_stub['target_node'],
-                        "edge_type": "MENTIONS",
-                        "weight": edge_stub['weight']
-                    })
-            
-            if final_edges:
-                supabase.table("knowledge_graph").upsert(
-                    final_edges, 
-                    on_conflict="source_node,target_node,edge_type", 
-                    ignore_duplicates=True
-                ).execute()
-                print(f"   ↳ Linked {len(final_edges)} graph edges.")
-                
-    except Exception as e:
-        print(f" ❌ News Upload Error: {str(e)[:100]}")
+    response = get_openai().embeddings.create(input=[text], model="text-embedding-3-small")
+    run_metrics.observe_embedding(response)
+    return response.data[0].embedding
 
 # --- PROCESSORS ---
 
-@retry(stop=stop_after_attempt(5), wait=wait_random_exponential(min=1, max=10))
+@retry(stop=stop_after_attempt(5), wait=wait_random_exponential(min=1, max=10),
+       before=run_metrics.tenacity_hook("fetch_ticker_history"))
 def fetch_ticker_history(ticker):
     url = f"{POLYGON_BASE_URL}/v2/aggs/ticker/{ticker}/range/1/day/{START_DATE}/{END_DATE}?adjusted=true&sort=asc&apiKey={MASSIVE_KEY}"
     
-    resp = requests.get(url, timeout=15)
-    
-    if resp.status_code == 429:
-        raise Exception("Rate Limited")
+    # 429s are absorbed by the shared limiter; tenacity only sees network errors
+    # or RateLimitExhausted.
+    resp = polygon_get(get_http_client(MAX_WORKERS), url, "aggs", timeout=15)
         
     if resp.status_code != 200:
         return []
@@ -212,6 +167,13 @@ def process_single_article(article):
                 "target_node": t,
                 "weight": 1.0
             })
+        for dup_url in article.get("duplicate_urls", []):
+            edge_stubs.append({
+                "source_url": url,
+                "target_node": dup_url,
+                "edge_type": DUPLICATE_EDGE_TYPE,
+                "weight": 1.0
+            })
             
         return vector_record, edge_stubs
     except Exception as e:
@@ -224,10 +186,15 @@ def backfill_news():
     
     total_processed = 0
     next_url = url
+    # Backfill starts from an empty window: everything it writes is new.
+    similarity = SimilarityLinker(get_db_writer(), phase="news.similarity")
+    dedup_index = DedupIndex()
+    news_writer = NewsGraphWriter(get_db_writer(), on_stored=similarity.add, dedup_index=dedup_index)
     
     while next_url:
         try:
-            resp = requests.get(next_url, timeout=20)
+            with run_metrics.phase("news.fetch"):
+                resp = polygon_get(get_http_client(MAX_WORKERS), next_url, "news", timeout=20)
             if resp.status_code != 200:
                 print(f"❌ News Error {resp.status_code}")
                 break
@@ -238,26 +205,26 @@ def backfill_news():
             if not articles: break
             
             print(f" 📥 Fetched {len(articles)} articles. Crunching embeddings in parallel...")
+            with run_metrics.phase("news.dedupe"):
+                articles = dedupe_articles(articles, index=dedup_index)
+            # Copies of stories stored from earlier pages reuse their vector.
+            for article in articles:
+                if "duplicate_of" in article:
+                    news_writer.add_edges(duplicate_edges(article, article["duplicate_of"]), article["article_url"])
+            articles = [a for a in articles if "duplicate_of" not in a]
             
-            page_vectors = []
-            page_edges = []
+            page_count = 0
             
-            with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-                results = list(executor.map(process_single_article, articles))
+            # Finished vectors stream straight into the writer, which uploads
+            # them in the background while the rest of the page is embedded.
+            with run_metrics.phase("news.embed"):
+                with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                    for vec, edges in executor.map(process_single_article, articles):
+                        if vec:
+                            news_writer.add(vec, edges)
+                            page_count += 1
                 
-                for vec, edges in results:
-                    if vec:
-                        page_vectors.append(vec)
-                        page_edges.extend(edges)
-            
-            chunk_size = 50
-            for i in range(0, len(page_vectors), chunk_size):
-                upload_news_batch(
-                    page_vectors[i:i+chunk_size], 
-                    page_edges 
-                )
-                
-            total_processed += len(page_vectors)
+            total_processed += page_count
             print(f" ✅ Page complete. Total embedded: {total_processed}")
             
             next_url = data.get("next_url")
@@ -268,33 +235,49 @@ def backfill_news():
             print(f" ❌ Critical Error in News Loop: {e}")
             break
 
+    with run_metrics.phase("news.upload"):
+        vectors_saved, edges_saved = news_writer.close()
+        similar_saved = similarity.flush()
+    print(f" 💾 Saved {vectors_saved} articles, linked {edges_saved} graph edges and {similar_saved} similarity links.")
+
+def backfill_stocks():
+    print(f"🚀 Backfilling STOCKS for {len(TICKER_UNIVERSE)} tickers...")
+    stock_writer = AdaptiveBatchWriter(get_db_writer(), "stocks_ohlc", on_conflict="ticker,date", ignore_duplicates=True)
+    
+    with run_metrics.phase("stocks"):
+        with run_metrics.phase("stocks.fetch"):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                future_to_ticker = {executor.submit(fetch_ticker_history, t): t for t in TICKER_UNIVERSE}
+                completed = 0
+                for future in concurrent.futures.as_completed(future_to_ticker):
+                    try:
+                        data = future.result()
+                        if data: stock_writer.extend(data)
+                    except Exception as e:
+                        print(f"Worker Error: {e}")
+                        run_metrics.inc("worker_errors_total", fn="fetch_ticker_history")
+                    completed += 1
+                    if completed % 50 == 0: print(f"  ... {completed}/{len(TICKER_UNIVERSE)}")
+
+        print("📦 Flushing remaining historical stock rows...")
+        with run_metrics.phase("stocks.upload"):
+            stock_writer.close()
+        print(f" 💾 Saved {stock_writer.rows_written} rows to DB ({stock_writer.rows_failed} failed).")
+
 # --- EXECUTION ---
 
 if __name__ == "__main__":
     start_time = time.time()
+    run_metrics.begin("backfill")
     
     # 1. Stocks
-    print(f"🚀 Backfilling STOCKS for {len(TICKER_UNIVERSE)} tickers...")
-    all_stock_records = []
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_ticker = {executor.submit(fetch_ticker_history, t): t for t in TICKER_UNIVERSE}
-        completed = 0
-        for future in concurrent.futures.as_completed(future_to_ticker):
-            try:
-                data = future.result()
-                if data: all_stock_records.extend(data)
-            except Exception as e:
-                print(f"Worker Error: {e}")
-            completed += 1
-            if completed % 50 == 0: print(f"  ... {completed}/{len(TICKER_UNIVERSE)}")
-
-    print(f"📦 Uploading {len(all_stock_records)} historical stock rows...")
-    for i in range(0, len(all_stock_records), DB_BATCH_SIZE):
-        batch = all_stock_records[i:i + DB_BATCH_SIZE]
-        upload_stock_batch(batch)
+    backfill_stocks()
     
     # 2. News
-    backfill_news()
+    with run_metrics.phase("news"):
+        backfill_news()
     
     print(f"\n✨ BACKFILL COMPLETE in {time.time() - start_time:.2f}s")
+    close_clients()
+    run_metrics.print_phase_table()
+    run_metrics.write_report()
@@ -0,0 +1,287 @@
+import os
+import time
+import threading
+import concurrent.futures
+from metrics import run_metrics
+
+# --- ADAPTIVE BATCH WRITER ---
+# Buffers rows for one table and flushes them in batches sized by estimated
+# payload bytes rather than row count (25 OHLC rows are ~2 KB, 25 embedding
+# rows are ~800 KB). Several batches are kept in flight on a small pool.
+# Batch size and in-flight concurrency grow while the database keeps up and
+# shrink only when it pushes back (slow responses or errors).
+
+DB_BATCH_TARGET_BYTES = int(os.getenv("DB_BATCH_TARGET_BYTES", str(256 * 1024)))
+DB_BATCH_MIN_BYTES = 16 * 1024
+DB_BATCH_MAX_BYTES = int(os.getenv("DB_BATCH_MAX_BYTES", str(4 * 1024 * 1024)))
+DB_BATCH_MAX_ROWS = 1000
+DB_MAX_IN_FLIGHT = int(os.getenv("DB_MAX_IN_FLIGHT", "4"))
+DB_TARGET_LATENCY = float(os.getenv("DB_TARGET_LATENCY", "1.5"))
+DB_WRITE_ATTEMPTS = 5
+MAX_SPLIT_DEPTH = 3
+
+
+def estimate_row_bytes(row):
+    """Cheap JSON-size estimate; avoids serializing 1536-float vectors twice."""
+    size = 2
+    for key, value in row.items():
+        size += len(key) + 4
+        if isinstance(value, (list, tuple)):
+            size += 20 * len(value)
+        elif isinstance(value, str):
+            size += len(value) + 2
+        else:
+            size += 12
+    return size
+
+
+class AdaptiveBatchWriter:
+    def __init__(self, writer, table, on_conflict, ignore_duplicates=False, returning=None,
+                 on_written=None, on_failed=None, target_bytes=DB_BATCH_TARGET_BYTES,
+                 max_in_flight=DB_MAX_IN_FLIGHT):
+        self.writer = writer
+        self.table = table
+        self.on_conflict = on_conflict
+        self.ignore_duplicates = ignore_duplicates
+        self.returning = returning
+        self.on_written = on_written
+        self.on_failed = on_failed
+
+        self.target_bytes = target_bytes
+        self.max_in_flight = max_in_flight
+        self.allowed_in_flight = float(max_in_flight)
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.callback_errors = 0
+
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._slots = threading.Condition(self._lock)
+        self._futures = []
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_in_flight, thread_name_prefix=f"writer-{table}"
+        )
+
+    def add(self, row):
+        batch = None
+        with self._lock:
+            self._buffer.append(row)
+            self._buffer_bytes += estimate_row_bytes(row)
+            if self._buffer_bytes >= self.target_bytes or len(self._buffer) >= DB_BATCH_MAX_ROWS:
+                batch = self._take_buffer()
+        if batch:
+            self._submit(batch)
+
+    def extend(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def flush(self):
+        with self._lock:
+            batch = self._take_buffer()
+        if batch:
+            self._submit(batch)
+
+    def close(self):
+        """Flushes the remaining rows and waits for every in-flight batch."""
+        self.flush()
+        while True:
+            with self._lock:
+                pending = [f for f in self._futures if not f.done()]
+                self._futures = pending
+            if not pending: break
+            concurrent.futures.wait(pending)
+        self._executor.shutdown(wait=True)
+
+    # --- INTERNALS ---
+
+    def _take_buffer(self):
+        batch = self._buffer
+        self._buffer = []
+        self._buffer_bytes = 0
+        return batch
+
+    def _submit(self, batch):
+        # Backpressure: the producer blocks while the allowed number of batches are in flight.
+        with self._slots:
+            while self._in_flight >= max(1, int(self.allowed_in_flight)):
+                self._slots.wait()
+            self._in_flight += 1
+            future = self._executor.submit(self._write, batch)
+            self._futures.append(future)
+        future.add_done_callback(self._check_result)
+
+    def _check_result(self, future):
+        # Upsert failures are handled in _write_with_retry; anything that gets
+        # here came from an on_written/on_failed callback and would otherwise
+        # vanish with the future.
+        e = future.exception()
+        if e is None: return
+        print(f" ❌ {self.table} post-write callback failed: {e!r}")
+        with self._lock:
+            self.callback_errors += 1
+        run_metrics.inc("batch_callback_errors_total", table=self.table)
+
+    def _release_slot(self):
+        with self._slots:
+            self._in_flight -= 1
+            self._slots.notify_all()
+
+    def _on_fast(self):
+        with self._lock:
+            self.target_bytes = min(DB_BATCH_MAX_BYTES, int(self.target_bytes * 1.25))
+            self.allowed_in_flight = min(self.max_in_flight, self.allowed_in_flight + 1.0 / max(self.allowed_in_flight, 1.0))
+            self._slots.notify_all()
+
+    def _on_pushback(self):
+        with self._lock:
+            self.target_bytes = max(DB_BATCH_MIN_BYTES, self.target_bytes // 2)
+            self.allowed_in_flight = max(1.0, self.allowed_in_flight / 2.0)
+        run_metrics.inc("db_pushback_total", table=self.table)
+
+    def _upsert(self, batch):
+        t0 = time.perf_counter()
+        written = self.writer.upsert(
+            self.table,
+            batch,
+            on_conflict=self.on_conflict,
+            ignore_duplicates=self.ignore_duplicates,
+            returning=self.returning
+        )
+        latency = time.perf_counter() - t0
+        if latency <= DB_TARGET_LATENCY:
+            self._on_fast()
+        elif latency > DB_TARGET_LATENCY * 2:
+            self._on_pushback()
+        return written
+
+    def _write(self, batch):
+        try:
+            self._write_with_retry(batch)
+        finally:
+            self._release_slot()
+
+    def _write_with_retry(self, batch, depth=0):
+        written = None
+        for attempt in range(1, DB_WRITE_ATTEMPTS + 1):
+            try:
+                written = self._upsert(batch)
+                break
+            except Exception as e:
+                self._on_pushback()
+                run_metrics.inc("retries_total", fn=f"batch_writer:{self.table}")
+                # An oversized payload may be the problem: split and retry the halves.
+                if depth < MAX_SPLIT_DEPTH and len(batch) > 1 and \
+                        sum(estimate_row_bytes(r) for r in batch) > self.target_bytes:
+                    mid = len(batch) // 2
+                    self._write_with_retry(batch[:mid], depth + 1)
+                    self._write_with_retry(batch[mid:], depth + 1)
+                    return
+                if attempt == DB_WRITE_ATTEMPTS:
+                    print(f" ❌ {self.table} batch of {len(batch)} failed after {attempt} attempts: {str(e)[:100]}")
+                    with self._lock:
+                        self.rows_failed += len(batch)
+                    run_metrics.inc("batches_failed_total", table=self.table)
+                    if self.on_failed:
+                        self.on_failed(batch)
+                    return
+                time.sleep(min(30.0, 0.5 * 2 ** attempt))
+
+        with self._lock:
+            self.rows_written += len(batch)
+        if self.on_written:
+            self.on_written(batch, written)
+
+
+class NewsGraphWriter:
+    """
+    Writes news_vectors rows and, once their ids come back, the edges
+    pointing out of each article (MENTIONS to tickers, SYNDICATED_AS to
+    near-duplicate URLs). `on_stored(ids, embeddings)` is called for every
+    batch that lands, e.g. to feed the similarity stage, and stored ids are
+    recorded in `dedup_index` when given. URLs whose vector or edges could
+    not be written are collected in `failed_urls`.
+    """
+    def __init__(self, writer, on_stored=None, dedup_index=None):
+        self.on_stored = on_stored
+        self.dedup_index = dedup_index
+        self.failed_urls = set()
+        self._pending_edges = {}
+        self._source_urls = {}
+        self._edge_urls = {}
+        self._lock = threading.Lock()
+        self.edges = AdaptiveBatchWriter(
+            writer, "knowledge_graph",
+            on_conflict="source_node,target_node,edge_type",
+            ignore_duplicates=True,
+            on_failed=self._edges_failed
+        )
+        self.vectors = AdaptiveBatchWriter(
+            writer, "news_vectors",
+            on_conflict="url",
+            returning=("url", "id"),
+            on_written=self._link_edges,
+            on_failed=self._vectors_failed
+        )
+
+    def add(self, vector_record, edge_stubs):
+        with self._lock:
+            self._pending_edges.setdefault(vector_record["url"], []).extend(edge_stubs)
+        self.vectors.add(vector_record)
+
+    def add_edges(self, edges, url):
+        """Edges out of an already stored article on behalf of `url` (e.g. a near-duplicate copy)."""
+        with self._lock:
+            for edge in edges:
+                self._edge_urls[(edge["source_node"], edge["target_node"], edge["edge_type"])] = url
+        self.edges.extend(edges)
+
+    def _vectors_failed(self, batch):
+        with self._lock:
+            for row in batch:
+                self._pending_edges.pop(row["url"], None)
+                self.failed_urls.add(row["url"])
+
+    def _link_edges(self, batch, written):
+        url_to_id = {item['url']: item['id'] for item in written or []}
+        final_edges = []
+        stored_ids, stored_vectors = [], []
+        with self._lock:
+            for row in batch:
+                stubs = self._pending_edges.pop(row["url"], [])
+                article_id = url_to_id.get(row["url"])
+                if not article_id:
+                    self.failed_urls.add(row["url"])
+                    continue
+                stored_ids.append(article_id)
+                stored_vectors.append(row["embedding"])
+                if self.dedup_index is not None:
+                    self.dedup_index.resolve(row["url"], article_id)
+                for stub in stubs:
+                    final_edges.append({
+                        "source_node": str(article_id),
+                        "target_node": stub['target_node'],
+                        "edge_type": stub.get('edge_type', "MENTIONS"),
+                        "weight": stub['weight']
+                    })
+                if stubs:
+                    self._source_urls[str(article_id)] = row["url"]
+        self.edges.extend(final_edges)
+        if self.on_stored and stored_ids:
+            self.on_stored(stored_ids, stored_vectors)
+
+    def _edges_failed(self, batch):
+        with self._lock:
+            for edge in batch:
+                url = self._edge_urls.get((edge["source_node"], edge["target_node"], edge["edge_type"])) \
+                    or self._source_urls.get(edge["source_node"])
+                if url: self.failed_urls.add(url)
+
+    def close(self):
+        self.vectors.close()
+        self.edges.close()
+        self._source_urls.clear()
+        self._edge_urls.clear()
+        return self.vectors.rows_written, self.edges.rows_written
@@ -0,0 +1,85 @@
+import os
+import sys
+import config  # noqa: F401
+
+# --- COPY WRITER CHECK ---
+# Exercises PostgresCopyWriter against a real Postgres with pgvector (a local
+# instance is fine): RETURNING ids, DO UPDATE vs DO NOTHING, duplicate
+# conflict keys within one batch, and vector round-trips. Uses a scratch
+# table that is dropped afterwards, so it never touches news_vectors.
+#
+#   DATABASE_URL=postgresql://localhost/postgres python check_copy_writer.py
+#
+# Skipped (exit 0) when DATABASE_URL is not set.
+
+TABLE = f"copy_writer_check_{os.getpid()}"
+
+
+def check(label, condition):
+    print(f"   {'✅' if condition else '❌'} {label}")
+    if not condition:
+        raise AssertionError(label)
+
+
+def run(dsn):
+    import psycopg
+    from db_writer import PostgresCopyWriter
+
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        conn.execute(f"""
+            CREATE TABLE {TABLE} (
+                id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+                url TEXT NOT NULL UNIQUE,
+                headline TEXT,
+                embedding VECTOR(3)
+            )
+        """)
+
+    writer = PostgresCopyWriter(dsn)
+    try:
+        print("🐘 Checking PostgresCopyWriter...")
+        rows = [
+            {"url": "a", "headline": "first", "embedding": [0.1, 0.2, 0.3]},
+            {"url": "b", "headline": "second", "embedding": [1.0, 0.0, -1.0]},
+        ]
+        written = writer.upsert(TABLE, rows, on_conflict="url", returning=("url", "id"))
+        ids = {r["url"]: r["id"] for r in written}
+        check("insert returns url/id for every row", set(ids) == {"a", "b"} and all(ids.values()))
+
+        updated = writer.upsert(TABLE, [{"url": "a", "headline": "edited", "embedding": [0.5, 0.5, 0.5]}],
+                                on_conflict="url", returning=("url", "id"))
+        check("DO UPDATE keeps the id", updated == [{"url": "a", "id": ids["a"]}])
+
+        ignored = writer.upsert(TABLE, [{"url": "b", "headline": "ignored", "embedding": [9, 9, 9]}],
+                                on_conflict="url", ignore_duplicates=True, returning=("url", "id"))
+        check("DO NOTHING returns no rows for existing keys", ignored == [])
+
+        dupes = [
+            {"url": "c", "headline": "older copy", "embedding": [0, 0, 1]},
+            {"url": "c", "headline": "newer copy", "embedding": [0, 1, 0]},
+        ]
+        written = writer.upsert(TABLE, dupes, on_conflict="url", returning=("url", "id"))
+        check("duplicate conflict keys in one batch collapse to one row", len(written) == 1)
+
+        with psycopg.connect(dsn) as conn:
+            stored = dict(
+                (url, (headline, emb)) for url, headline, emb in
+                conn.execute(f"SELECT url, headline, embedding::text FROM {TABLE}").fetchall()
+            )
+        check("DO UPDATE wrote the new values", stored["a"] == ("edited", "[0.5,0.5,0.5]"))
+        check("DO NOTHING left the row untouched", stored["b"] == ("second", "[1,0,-1]"))
+        check("last duplicate in a batch wins", stored["c"] == ("newer copy", "[0,1,0]"))
+    finally:
+        writer.close()
+        with psycopg.connect(dsn, autocommit=True) as conn:
+            conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+if __name__ == "__main__":
+    dsn = os.getenv("DATABASE_URL")
+    if not dsn:
+        print("⏭️ DATABASE_URL is not set; skipping the COPY writer check.")
+        sys.exit(0)
+    run(dsn)
+    print("✨ COPY writer OK")
@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+from datetime import datetime, timedelta
+import config  # noqa: F401
+
+# --- MIRROR CHECK ---
+# Compares AnalyticsMirror.daily_market_vectors with the
+# get_daily_market_vectors RPC for one date: same tickers, near-identical
+# mean vectors and the same headline per ticker. Run it before switching
+# generate_history to READ_FROM_MIRROR=1, and after changing either side.
+#
+#   python check_mirror.py --date 2025-10-01
+#
+# Syncs the mirror first. Skipped (exit 0) when SUPABASE_URL is not set.
+
+MIN_COSINE = 0.999
+
+
+def _as_vector(vec):
+    if isinstance(vec, str): vec = json.loads(vec)
+    return np.asarray(vec, dtype=np.float32)
+
+
+def compare(rpc_rows, mirror_rows):
+    """Returns a list of human-readable mismatches (empty when both paths agree)."""
+    rpc = {r["ticker"]: r for r in rpc_rows}
+    local = {r["ticker"]: r for r in mirror_rows}
+    problems = []
+    for ticker in sorted(rpc.keys() - local.keys()):
+        problems.append(f"{ticker}: only in the RPC")
+    for ticker in sorted(local.keys() - rpc.keys()):
+        problems.append(f"{ticker}: only in the mirror")
+
+    for ticker in sorted(rpc.keys() & local.keys()):
+        a, b = _as_vector(rpc[ticker]["vector"]), _as_vector(local[ticker]["vector"])
+        if a.shape != b.shape:
+            problems.append(f"{ticker}: vector shape {a.shape} vs {b.shape}")
+            continue
+        cosine = float(a @ b / ((np.linalg.norm(a) * np.linalg.norm(b)) or 1.0))
+        if cosine < MIN_COSINE:
+            problems.append(f"{ticker}: mean vectors differ (cosine {cosine:.4f})")
+        if (rpc[ticker].get("headline") or "") != (local[ticker].get("headline") or ""):
+            problems.append(f"{ticker}: headline {rpc[ticker].get('headline')!r} vs {local[ticker].get('headline')!r}")
+    return problems
+
+
+def run(target_date):
+    from generate_history import fetch_daily_rows_rpc
+    from mirror import get_mirror
+
+    print(f"🪞 Comparing daily market vectors for {target_date}...")
+    rpc_rows = fetch_daily_rows_rpc(target_date)
+    mirror_rows = get_mirror(sync=True).daily_market_vectors(target_date)
+    print(f"   > RPC: {len(rpc_rows)} tickers, mirror: {len(mirror_rows)} tickers")
+
+    problems = compare(rpc_rows, mirror_rows)
+    for problem in problems[:50]:
+        print(f"   ❌ {problem}")
+    if len(problems) > 50:
+        print(f"   ... and {len(problems) - 50} more")
+    return not problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare mirror and RPC daily market vectors.")
+    parser.add_argument("--date", default=(datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d"),
+                        help="Date to compare (default: yesterday).")
+    args = parser.parse_args()
+
+    if not os.getenv("SUPABASE_URL"):
+        print("⏭️ SUPABASE_URL is not set; skipping the mirror check.")
+        sys.exit(0)
+    if not run(args.date):
+        sys.exit(1)
+    print("✨ Mirror matches the RPC")
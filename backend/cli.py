@@ -0,0 +1,152 @@
+import time
+import argparse
+import config  # noqa: F401
+from metrics import run_metrics
+from news_firehose import NEWS_POLL_INTERVAL
+
+# --- UNIFIED CLI ---
+# One entry point for every backend job, one subcommand per phase, so cron
+# can run just what is due (e.g. OHLC once a day after the close, news every
+# few minutes, history nightly). Each job module is imported only by the
+# subcommand that needs it, and clients are created on first use, so a phase
+# never loads umap/networkx/pandas/openai for work it does not do.
+#
+#   python cli.py ohlc
+#   python cli.py news            # fetch and spool for a separate `embed` run
+#   python cli.py news --embed    # fetch, embed and store in one go
+#   python cli.py embed
+#   python cli.py communities --source blend
+#   python cli.py backfill-stocks
+#   python cli.py backfill-news
+#   python cli.py history --days 30
+#   python cli.py sync-mirror       # refresh the local read mirror (READ_FROM_MIRROR=1)
+
+
+def cmd_ohlc(args):
+    import ingest
+    ingest.run_ohlc_phase()
+
+
+def cmd_news(args):
+    import ingest
+    if args.poll:
+        from news_firehose import run_ingest_poller
+        run_ingest_poller(interval=args.interval)
+        return
+
+    spool = ingest.load_news_spool()
+    # A spooled firehose cursor is ahead of the saved one until `embed` commits it.
+    articles, next_cursor = ingest.fetch_news_phase(cursor=spool["next_cursor"])
+    if args.embed:
+        failed = ingest.run_embed_phase(spool["articles"] + articles, next_cursor or spool["next_cursor"])
+        _respool_failed(ingest, failed)
+    else:
+        ingest.spool_news(articles, next_cursor)
+
+
+def cmd_embed(args):
+    import ingest
+    spool = ingest.load_news_spool()
+    if not spool["articles"]:
+        print("   > 💤 News spool is empty. Nothing to embed.")
+        return
+    print(f"   > Embedding {len(spool['articles'])} spooled stories...")
+    failed = ingest.run_embed_phase(spool["articles"], spool["next_cursor"])
+    _respool_failed(ingest, failed)
+
+
+def _respool_failed(ingest, failed):
+    # The cursor (if any) is already saved and held at the first failure; the
+    # spool keeps just the unstored stories for the next embed run.
+    ingest.clear_news_spool()
+    if failed:
+        ingest.spool_news(failed, None)
+
+
+def cmd_communities(args):
+    import ingest
+    ingest.run_community_phase(source=args.source)
+
+
+def cmd_backfill_stocks(args):
+    import backfill_engine
+    backfill_engine.backfill_stocks()
+
+
+def cmd_backfill_news(args):
+    import backfill_engine
+    with run_metrics.phase("news"):
+        backfill_engine.backfill_news()
+
+
+def cmd_history(args):
+    import generate_history
+    options = {k: v for k, v in (("history_days", args.days), ("output_path", args.output)) if v is not None}
+    generate_history.generate_history(**options)
+
+
+def cmd_sync_mirror(args):
+    from mirror import AnalyticsMirror
+    from clients import get_supabase
+    mirror = AnalyticsMirror()
+    try:
+        mirror.sync(get_supabase(), tables=args.table, full=args.full)
+    finally:
+        mirror.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="CatInCloud backend jobs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("ohlc", help="Fetch yesterday's OHLC bars for the ticker universe.").set_defaults(func=cmd_ohlc)
+
+    news = sub.add_parser("news", help="Fetch news (per ticker or firehose, per NEWS_SOURCE).")
+    news.add_argument("--embed", action="store_true", help="Embed and store immediately instead of spooling.")
+    news.add_argument("--poll", action="store_true", help="Run the firehose poller until interrupted.")
+    news.add_argument("--interval", type=int, default=NEWS_POLL_INTERVAL, help="Seconds between polls with --poll.")
+    news.set_defaults(func=cmd_news)
+
+    sub.add_parser("embed", help="Embed and store spooled news, then advance the firehose cursor.").set_defaults(func=cmd_embed)
+
+    communities = sub.add_parser("communities", help="Run Louvain community detection.")
+    communities.add_argument("--source", choices=["news", "price", "blend"], default=None,
+                             help="Graph to cluster (default: COMMUNITY_SOURCE).")
+    communities.set_defaults(func=cmd_communities)
+
+    sub.add_parser("backfill-stocks", help="Backfill daily bars from START_DATE.").set_defaults(func=cmd_backfill_stocks)
+    sub.add_parser("backfill-news", help="Backfill and embed the news archive.").set_defaults(func=cmd_backfill_news)
+
+    history = sub.add_parser("history", help="Regenerate the walk-forward market map history.")
+    history.add_argument("--days", type=int, help="Number of days to generate (default: HISTORY_DAYS).")
+    history.add_argument("--output", help="Output JSON path (default: the frontend's public/data file).")
+    history.set_defaults(func=cmd_history)
+
+    sync = sub.add_parser("sync-mirror", help="Pull new and changed rows into the local mirror.")
+    sync.add_argument("--table", action="append", choices=["stocks_ohlc", "news_vectors", "knowledge_graph"],
+                      help="Limit to a table (repeatable). Default: all three. "
+                           "knowledge_graph follows the news_vectors already in the mirror.")
+    sync.add_argument("--full", action="store_true", help="Drop local rows and resync from scratch.")
+    sync.set_defaults(func=cmd_sync_mirror)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    # One report per subcommand, e.g. run_reports/news.prom, so each cron job is monitored separately.
+    job = args.command.replace("-", "_")
+    run_metrics.begin(job)
+    start_time = time.time()
+    try:
+        args.func(args)
+    finally:
+        from clients import close_clients
+        close_clients()
+        print(f"\n✨ {args.command} finished in {time.time() - start_time:.2f}s")
+        run_metrics.print_phase_table()
+        run_metrics.write_report()
+
+
+if __name__ == "__main__":
+    main()
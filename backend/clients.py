@@ -0,0 +1,56 @@
+import os
+import threading
+import config  # noqa: F401
+
+# --- LAZY CLIENTS ---
+# OpenAI, Supabase and the DB writer are created on first use, not at import
+# time, so a job that only needs one phase does not pay for the others
+# (or fail because their credentials are missing).
+
+_lock = threading.Lock()
+_supabase_clients = {}
+_openai_client = None
+_db_writer = None
+
+
+def get_supabase(postgrest_timeout=None):
+    """Returns a cached Supabase client; one per distinct PostgREST timeout."""
+    with _lock:
+        client = _supabase_clients.get(postgrest_timeout)
+        if client is None:
+            from supabase import create_client, ClientOptions
+            kwargs = {}
+            if postgrest_timeout is not None:
+                kwargs["options"] = ClientOptions(postgrest_client_timeout=postgrest_timeout)
+            client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"), **kwargs)
+            _supabase_clients[postgrest_timeout] = client
+        return client
+
+
+def get_openai():
+    global _openai_client
+    with _lock:
+        if _openai_client is None:
+            from openai import OpenAI
+            _openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return _openai_client
+
+
+def get_db_writer():
+    global _db_writer
+    supabase = get_supabase()
+    with _lock:
+        if _db_writer is None:
+            from db_writer import make_db_writer
+            _db_writer = make_db_writer(supabase)
+        return _db_writer
+
+
+def close_clients():
+    global _db_writer
+    from http_client import close_http_client
+    close_http_client()
+    with _lock:
+        if _db_writer is not None:
+            _db_writer.close()
+            _db_writer = None
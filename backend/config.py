@@ -0,0 +1,10 @@
+from dotenv import load_dotenv
+
+# --- ENVIRONMENT ---
+# Settings are read into module constants at import time (rate limits, pool
+# sizes, feature switches), so backend/.env has to be loaded before any of
+# those modules is imported. Entry points and env-reading modules import
+# this first; load_dotenv never overrides variables already set in the
+# process environment.
+
+load_dotenv()
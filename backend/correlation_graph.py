@@ -0,0 +1,174 @@
+import os
+import numpy as np
+import networkx as nx
+from datetime import datetime, timedelta
+from metrics import run_metrics
+
+# --- PRICE CORRELATION GRAPH ---
+# Builds a ticker-to-ticker graph from co-movement in daily closes so the
+# community detector can cluster on price physics, not just news co-mentions.
+# Everything after the bulk load is matrix algebra over a (dates x tickers)
+# array: log returns, per-window standardization, Z'Z correlation, optional
+# shrinkage, and an argpartition top-k / threshold sparsifier. No per-pair
+# Python loops, so it stays fast at thousands of tickers.
+
+CORR_LOOKBACK_DAYS = int(os.getenv("CORR_LOOKBACK_DAYS", "120"))
+CORR_WINDOW = int(os.getenv("CORR_WINDOW", "60"))            # trading days per correlation window
+CORR_SMOOTHING_WINDOWS = int(os.getenv("CORR_SMOOTHING_WINDOWS", "5"))
+CORR_SHRINKAGE = os.getenv("CORR_SHRINKAGE", "auto")       # 'auto' (Ledoit-Wolf), a float in [0, 1], or '0'
+CORR_TOP_K = int(os.getenv("CORR_TOP_K", "8"))
+CORR_THRESHOLD = float(os.getenv("CORR_THRESHOLD", "0.5"))
+CORR_MIN_COVERAGE = 0.8                                     # share of days a ticker must have a close
+BLEND_PRICE_WEIGHT = float(os.getenv("BLEND_PRICE_WEIGHT", "0.5"))
+
+
+def load_close_matrix(supabase_client, tickers=None, lookback_days=CORR_LOOKBACK_DAYS, page_size=1000, mirror=None):
+    """
+    Pulls (ticker, date, close) in bulk (from the local mirror when given) and
+    pivots to a dates x tickers float matrix. Rows without a close (label-only
+    rows for a day whose bars have not landed) are skipped, and pages are
+    ordered by (date, ticker) so offsets never repeat or drop rows.
+    """
+    import pandas as pd
+    since = (datetime.now() - timedelta(days=lookback_days)).strftime('%Y-%m-%d')
+    rows = mirror.close_rows(since) if mirror is not None else []
+    offset = 0
+    while mirror is None:
+        resp = supabase_client.table("stocks_ohlc")\
+            .select("ticker, date, close")\
+            .gte("date", since)\
+            .not_.is_("close", "null")\
+            .order("date").order("ticker")\
+            .range(offset, offset + page_size - 1).execute()
+        if not resp.data: break
+        rows.extend(resp.data)
+        if len(resp.data) < page_size: break
+        offset += page_size
+
+    if not rows: return [], [], np.empty((0, 0))
+    frame = pd.DataFrame(rows)
+    if tickers is not None:
+        frame = frame[frame["ticker"].isin(set(tickers))]
+    closes = frame.pivot_table(index="date", columns="ticker", values="close", aggfunc="last").sort_index()
+    return list(closes.index), list(closes.columns), closes.to_numpy(dtype=np.float64)
+
+
+def log_returns(closes):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logs = np.log(np.where(closes > 0, closes, np.nan))
+    return np.diff(logs, axis=0)
+
+
+def _shrinkage_intensity(z, shrinkage):
+    if shrinkage == "auto":
+        from sklearn.covariance import ledoit_wolf
+        _, intensity = ledoit_wolf(z, assume_centered=True)
+        return float(intensity)
+    return float(shrinkage)
+
+
+def correlation_matrix(returns, shrinkage=CORR_SHRINKAGE):
+    """
+    Correlation of a (days x tickers) return window. Missing returns are
+    treated as zero after standardizing (i.e. no information), which keeps
+    it a single matmul. Shrinks toward the identity by the given intensity.
+    """
+    mask = ~np.isnan(returns)
+    counts = np.maximum(mask.sum(axis=0), 1)
+    filled = np.where(mask, returns, 0.0)
+    means = filled.sum(axis=0) / counts
+    centered = np.where(mask, returns - means, 0.0)
+    stds = np.sqrt((centered ** 2).sum(axis=0) / np.maximum(counts - 1, 1))
+    stds[stds == 0] = np.inf
+    z = centered / stds
+
+    corr = (z.T @ z) / max(len(returns) - 1, 1)
+    intensity = _shrinkage_intensity(z, shrinkage) if shrinkage not in (None, "") else 0.0
+    if intensity > 0:
+        # Ledoit-Wolf target for standardized data is the identity: shrink off-diagonals only.
+        corr = (1.0 - intensity) * corr
+    np.fill_diagonal(corr, 1.0)
+    return np.clip(corr, -1.0, 1.0)
+
+
+def rolling_correlation_matrices(returns, window=CORR_WINDOW, n_windows=CORR_SMOOTHING_WINDOWS,
+                                 shrinkage=CORR_SHRINKAGE):
+    """Yields the correlation matrix for each of the last n_windows windows (oldest first)."""
+    total = len(returns)
+    if total < window: window = total
+    first_end = max(window, total - n_windows + 1)
+    for end in range(first_end, total + 1):
+        yield correlation_matrix(returns[end - window:end], shrinkage)
+
+
+def smoothed_correlation(returns, window=CORR_WINDOW, n_windows=CORR_SMOOTHING_WINDOWS,
+                         shrinkage=CORR_SHRINKAGE):
+    """Mean of the trailing rolling windows, so one noisy day does not rewire the graph."""
+    acc = None
+    n = 0
+    for corr in rolling_correlation_matrices(returns, window, n_windows, shrinkage):
+        acc = corr if acc is None else acc + corr
+        n += 1
+    return acc / n if n else None
+
+
+def sparsify(corr, top_k=CORR_TOP_K, threshold=CORR_THRESHOLD):
+    """
+    Keeps an edge (i, j) if j is among i's top-k correlations or vice versa,
+    and the correlation clears the threshold. Returns (rows, cols, weights)
+    for the upper triangle.
+    """
+    n = corr.shape[0]
+    if n < 2: return np.empty(0, int), np.empty(0, int), np.empty(0)
+    work = corr.copy()
+    np.fill_diagonal(work, -np.inf)
+
+    kk = min(top_k, n - 1)
+    top = np.argpartition(-work, kk - 1, axis=1)[:, :kk]
+    keep = np.zeros_like(work, dtype=bool)
+    np.put_along_axis(keep, top, True, axis=1)
+    keep |= keep.T
+    keep &= work >= threshold
+
+    rows, cols = np.nonzero(np.triu(keep, k=1))
+    return rows, cols, corr[rows, cols]
+
+
+def build_price_graph(tickers, closes, window=CORR_WINDOW, top_k=CORR_TOP_K,
+                      threshold=CORR_THRESHOLD, shrinkage=CORR_SHRINKAGE):
+    """Full pipeline from a close matrix to a weighted NetworkX graph of tickers."""
+    graph = nx.Graph()
+    if closes.size == 0: return graph
+
+    with run_metrics.phase("communities.price_graph"):
+        returns = log_returns(closes)
+        coverage = (~np.isnan(returns)).mean(axis=0)
+        usable = coverage >= CORR_MIN_COVERAGE
+        tickers = np.asarray(tickers)[usable]
+        returns = returns[:, usable]
+        if len(tickers) < 2 or len(returns) < 3: return graph
+
+        corr = smoothed_correlation(returns, window=window, shrinkage=shrinkage)
+        rows, cols, weights = sparsify(corr, top_k=top_k, threshold=threshold)
+
+        # Tickers with no edge above threshold are left out, like unmentioned tickers in the news graph.
+        graph.add_weighted_edges_from(zip(tickers[rows].tolist(), tickers[cols].tolist(), weights.tolist()))
+
+    print(f"   > 📈 Price Graph: {len(tickers)} Tickers, {graph.number_of_edges()} Links "
+          f"(window={min(window, len(returns))}d, top_k={top_k}, threshold={threshold})")
+    return graph
+
+
+def blend_graphs(news_graph, price_graph, price_weight=BLEND_PRICE_WEIGHT):
+    """
+    Union of both graphs with each side's weights scaled to [0, 1] first, so
+    raw co-mention counts do not swamp correlations (or vice versa).
+    """
+    blended = nx.Graph()
+    for graph, share in ((news_graph, 1.0 - price_weight), (price_graph, price_weight)):
+        if graph is None or graph.number_of_edges() == 0 or share <= 0: continue
+        max_w = max(w for _, _, w in graph.edges(data="weight", default=1.0)) or 1.0
+        for u, v, w in graph.edges(data="weight", default=1.0):
+            prev = blended[u][v]["weight"] if blended.has_edge(u, v) else 0.0
+            blended.add_edge(u, v, weight=prev + share * (w / max_w))
+    return blended
@@ -0,0 +1,163 @@
+import os
+import time
+import threading
+import config  # noqa: F401
+from metrics import run_metrics
+from batch_writer import DB_MAX_IN_FLIGHT, estimate_row_bytes
+
+# --- DATABASE WRITERS ---
+# Two interchangeable write paths behind one `upsert()` call:
+#   * PostgrestWriter - the default, goes through supabase-py / PostgREST.
+#   * PostgresCopyWriter - connects straight to Postgres with a pool, COPYs the
+#     batch into a temp staging table and merges with INSERT ... ON CONFLICT.
+#     One round trip per batch instead of one JSON-encoded HTTP request, which
+#     matters for 1536-dim embedding rows during large backfills.
+#
+# Select with DB_WRITER=copy and DATABASE_URL=postgresql://... (the Supabase
+# direct/pooler connection string, or a local Postgres for testing).
+
+DB_WRITER = os.getenv("DB_WRITER", "postgrest")
+DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+# News ingest runs three batch writers at once (vectors, MENTIONS edges and
+# SIMILAR_TO edges), each with up to DB_MAX_IN_FLIGHT upserts outstanding.
+# A smaller pool makes batches queue for a connection, which reads as slow
+# writes and triggers needless backoff.
+DB_CONCURRENT_WRITERS = 3
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", str(DB_CONCURRENT_WRITERS * DB_MAX_IN_FLIGHT)))
+
+
+def _record_columns(rows):
+    """Union of keys across rows, in first-seen order."""
+    columns = []
+    seen = set()
+    for row in rows:
+        for key in row:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    return columns
+
+
+class PostgrestWriter:
+    def __init__(self, supabase_client):
+        self.supabase = supabase_client
+
+    def upsert(self, table, rows, on_conflict, ignore_duplicates=False, returning=None):
+        """Upserts rows. Returns the written rows when `returning` is set, else []."""
+        if not rows: return []
+        t0 = time.perf_counter()
+        res = self.supabase.table(table).upsert(
+            rows,
+            on_conflict=on_conflict,
+            ignore_duplicates=ignore_duplicates
+        ).execute()
+        run_metrics.observe_upsert(table, len(rows), sum(estimate_row_bytes(r) for r in rows),
+                                   time.perf_counter() - t0)
+        if not returning: return []
+        return [{k: item.get(k) for k in returning} for item in (res.data or [])]
+
+    def close(self):
+        pass
+
+
+class PostgresCopyWriter:
+    def __init__(self, dsn, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE):
+        # Optional dependency: only needed when DB_WRITER=copy.
+        from psycopg_pool import ConnectionPool
+        self.pool = ConnectionPool(dsn, min_size=min_size, max_size=max_size, open=True)
+        self._stage_seq = 0
+        self._seq_lock = threading.Lock()
+
+    def _stage_name(self):
+        with self._seq_lock:
+            self._stage_seq += 1
+            return f"_stage_{self._stage_seq}"
+
+    @staticmethod
+    def _copy_value(value):
+        # pgvector parses '[1,2,3]'; everything else goes through psycopg's dumpers.
+        if isinstance(value, (list, tuple)):
+            return "[" + ",".join(repr(float(v)) for v in value) + "]"
+        return value
+
+    def upsert(self, table, rows, on_conflict, ignore_duplicates=False, returning=None):
+        """
+        Same contract as PostgrestWriter.upsert: ON CONFLICT DO NOTHING when
+        ignore_duplicates, otherwise DO UPDATE of every supplied column.
+        Duplicate conflict keys inside one batch are collapsed (last row wins)
+        so the merge never touches the same row twice.
+        """
+        from psycopg import sql
+        if not rows: return []
+
+        columns = _record_columns(rows)
+        conflict_cols = [c.strip() for c in on_conflict.split(",")]
+        update_cols = [c for c in columns if c not in conflict_cols]
+        stage = self._stage_name()
+
+        deduped = {}
+        for row in rows:
+            deduped[tuple(row.get(c) for c in conflict_cols)] = row
+        rows = list(deduped.values())
+
+        col_ids = sql.SQL(", ").join(map(sql.Identifier, columns))
+        conflict_ids = sql.SQL(", ").join(map(sql.Identifier, conflict_cols))
+
+        if ignore_duplicates or not update_cols:
+            action = sql.SQL("DO NOTHING")
+        else:
+            action = sql.SQL("DO UPDATE SET ") + sql.SQL(", ").join(
+                sql.SQL("{c} = EXCLUDED.{c}").format(c=sql.Identifier(c)) for c in update_cols
+            )
+
+        merge = sql.SQL("INSERT INTO {table} ({cols}) SELECT {cols} FROM {stage} ON CONFLICT ({conflict}) ").format(
+            table=sql.Identifier(table), cols=col_ids, stage=sql.Identifier(stage), conflict=conflict_ids
+        ) + action
+        if returning:
+            merge += sql.SQL(" RETURNING ") + sql.SQL(", ").join(map(sql.Identifier, returning))
+
+        copy_rows = [tuple(self._copy_value(row.get(c)) for c in columns) for row in rows]
+        payload_bytes = sum(len(str(v)) + 1 for r in copy_rows for v in r)
+
+        t0 = time.perf_counter()
+        written = []
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                with conn.cursor() as cur:
+                    # CREATE ... AS SELECT copies column types but not NOT NULL/identity constraints.
+                    cur.execute(sql.SQL(
+                        "CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {cols} FROM {table} WITH NO DATA"
+                    ).format(stage=sql.Identifier(stage), cols=col_ids, table=sql.Identifier(table)))
+
+                    copy_stmt = sql.SQL("COPY {stage} ({cols}) FROM STDIN").format(
+                        stage=sql.Identifier(stage), cols=col_ids
+                    )
+                    with cur.copy(copy_stmt) as copy:
+                        for copy_row in copy_rows:
+                            copy.write_row(copy_row)
+
+                    cur.execute(merge)
+                    if returning:
+                        written = [dict(zip(returning, r)) for r in cur.fetchall()]
+
+        run_metrics.observe_upsert(table, len(rows), payload_bytes, time.perf_counter() - t0)
+        return written
+
+    def close(self):
+        self.pool.close()
+
+
+def make_db_writer(supabase_client):
+    """Picks the write path from DB_WRITER / DATABASE_URL, defaulting to PostgREST."""
+    if DB_WRITER == "copy":
+        if not DATABASE_URL:
+            print("   > ⚠️ DB_WRITER=copy but DATABASE_URL is not set. Using PostgREST.")
+        else:
+            try:
+                writer = PostgresCopyWriter(DATABASE_URL)
+                print("   > 🐘 Using direct Postgres COPY writer.")
+                return writer
+            except ImportError:
+                print("   > ⚠️ DB_WRITER=copy needs `psycopg[binary,pool]`. Using PostgREST.")
+    return PostgrestWriter(supabase_client)
@@ -0,0 +1,211 @@
+import os
+import re
+import zlib
+import threading
+from collections import OrderedDict
+from itertools import combinations
+import numpy as np
+from metrics import run_metrics
+
+# --- NEAR-DUPLICATE DETECTION ---
+# Syndicated and lightly rewritten wire stories arrive under different
+# article_urls, so exact-URL dedupe lets them through and we pay to embed
+# and store the same text many times. MinHash signatures over character
+# shingles of "headline: description" + LSH banding find near-duplicates in
+# roughly linear time; each cluster keeps one canonical article (the earliest
+# published) that carries the merged tickers of every copy.
+#
+# A DedupIndex keeps the signatures of recently stored canonicals across
+# batches (one firehose poll, one backfill page), so a copy that arrives a
+# poll later is linked to the stored canonical's vector instead of being
+# embedded again.
+
+NUM_PERM = 128
+LSH_BANDS = 16           # 16 bands x 8 rows -> candidate threshold ~0.71
+LSH_ROWS = NUM_PERM // LSH_BANDS
+NEAR_DUP_THRESHOLD = 0.8  # estimated Jaccard needed to confirm a candidate pair
+SHINGLE_SIZE = 5
+DUPLICATE_EDGE_TYPE = "SYNDICATED_AS"
+DEDUP_WINDOW_SIZE = int(os.getenv("DEDUP_WINDOW_SIZE", "5000"))
+
+_PRIME = np.uint64(4294967291)  # largest prime < 2^32, so a*x + b fits in uint64
+_rng = np.random.default_rng(7)
+_PERM_A = _rng.integers(1, int(_PRIME), NUM_PERM, dtype=np.uint64)[:, None]
+_PERM_B = _rng.integers(0, int(_PRIME), NUM_PERM, dtype=np.uint64)[:, None]
+_EMPTY_SIGNATURE = np.full(NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+
+
+def article_text(article):
+    headline = article.get("title", "") or ""
+    description = article.get("description", "") or ""
+    return f"{headline}: {description}"
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", re.sub(r"[^a-z0-9 ]", " ", text.lower())).strip()
+
+
+def minhash_signature(text):
+    text = _normalize(text)
+    if len(text) < SHINGLE_SIZE: return _EMPTY_SIGNATURE
+    shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # (NUM_PERM, 1) x (1, n) universal hashes, min over shingles
+    return ((_PERM_A * hashes[None, :] + _PERM_B) % _PRIME).min(axis=1)
+
+
+def _band_keys(signature):
+    for band in range(LSH_BANDS):
+        yield band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes()
+
+
+def _is_empty(signature):
+    return signature[0] == _EMPTY_SIGNATURE[0]
+
+
+class DedupIndex:
+    """
+    Rolling LSH index of the last `window` canonicals, keyed by article_url.
+    Entries are remembered when a batch is deduped and only match once
+    `resolve` has recorded their stored news_vectors id.
+    """
+    def __init__(self, window=DEDUP_WINDOW_SIZE):
+        self.window = window
+        self._entries = OrderedDict()  # url -> [signature, article id or None]
+        self._buckets = {}             # (band, band bytes) -> set of urls
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def remember(self, url, signature):
+        if not url or _is_empty(signature): return
+        with self._lock:
+            if url in self._entries:
+                self._entries.move_to_end(url)
+                return
+            self._entries[url] = [signature, None]
+            for key in _band_keys(signature):
+                self._buckets.setdefault(key, set()).add(url)
+            while len(self._entries) > self.window:
+                old_url, (old_signature, _) = self._entries.popitem(last=False)
+                for key in _band_keys(old_signature):
+                    members = self._buckets[key]
+                    members.discard(old_url)
+                    if not members: del self._buckets[key]
+
+    def resolve(self, url, article_id):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None: entry[1] = article_id
+
+    def match(self, signature):
+        """(url, article id) of the most similar stored canonical above NEAR_DUP_THRESHOLD, else None."""
+        if _is_empty(signature): return None
+        best, best_score = None, NEAR_DUP_THRESHOLD
+        with self._lock:
+            candidates = set()
+            for key in _band_keys(signature):
+                candidates.update(self._buckets.get(key, ()))
+            for url in candidates:
+                stored_signature, article_id = self._entries[url]
+                if article_id is None: continue
+                score = np.mean(stored_signature == signature)
+                if score >= best_score:
+                    best, best_score = (url, article_id), score
+        return best
+
+
+def duplicate_edges(article, canonical_id):
+    """Edges linking a copy to its stored canonical: MENTIONS for the copy's tickers, SYNDICATED_AS for its URLs."""
+    source = str(canonical_id)
+    edges = [{"source_node": source, "target_node": t, "edge_type": "MENTIONS", "weight": 1.0}
+             for t in article.get("tickers", [])]
+    urls = [article.get("article_url")] + article.get("duplicate_urls", [])
+    edges.extend({"source_node": source, "target_node": url, "edge_type": DUPLICATE_EDGE_TYPE, "weight": 1.0}
+                 for url in urls if url)
+    return edges
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def dedupe_articles(articles, index=None):
+    """
+    Collapses near-duplicate articles. Returns the canonical articles (copies),
+    each with `tickers` merged across its cluster and `duplicate_urls` listing
+    the URLs it absorbed. Input order is preserved for canonicals.
+
+    With an `index`, a canonical that matches one already stored gets
+    `duplicate_of` (that article's id) and should be linked with
+    duplicate_edges rather than embedded; the others are remembered in it.
+    """
+    if not articles or (len(articles) < 2 and index is None): return list(articles)
+
+    signatures = np.stack([minhash_signature(article_text(a)) for a in articles])
+    parent = list(range(len(articles)))
+
+    buckets = {}
+    for idx in range(len(articles)):
+        if _is_empty(signatures[idx]): continue
+        for key in _band_keys(signatures[idx]):
+            buckets.setdefault(key, []).append(idx)
+
+    checked = set()
+    for members in buckets.values():
+        if len(members) < 2: continue
+        for i, j in combinations(members, 2):
+            if (i, j) in checked: continue
+            checked.add((i, j))
+            if np.mean(signatures[i] == signatures[j]) >= NEAR_DUP_THRESHOLD:
+                ri, rj = _find(parent, i), _find(parent, j)
+                if ri != rj: parent[rj] = ri
+
+    clusters = {}
+    for idx in range(len(articles)):
+        clusters.setdefault(_find(parent, idx), []).append(idx)
+
+    canonicals = []
+    duplicates = 0
+    matches = []
+    for members in sorted(clusters.values(), key=lambda m: m[0]):
+        group = [articles[i] for i in members]
+        first = min(members, key=lambda i: articles[i].get("published_utc") or "")
+        canonical = dict(articles[first])
+        if len(group) > 1:
+            tickers = []
+            for art in group:
+                for t in art.get("tickers", []):
+                    if t not in tickers: tickers.append(t)
+            canonical["tickers"] = tickers
+            canonical["duplicate_urls"] = [
+                a["article_url"] for a in group
+                if a.get("article_url") and a.get("article_url") != canonical.get("article_url")
+            ]
+            duplicates += len(group) - 1
+        canonicals.append(canonical)
+        matches.append(first)
+
+    late = 0
+    if index is not None:
+        # Matched against earlier batches only; this batch is remembered afterwards.
+        for canonical, first in zip(canonicals, matches):
+            match = index.match(signatures[first])
+            # The same URL fetched again is a re-upsert, not a copy.
+            if match and match[0] != canonical.get("article_url"):
+                canonical["duplicate_of"] = match[1]
+                late += 1
+        for canonical, first in zip(canonicals, matches):
+            if "duplicate_of" not in canonical:
+                index.remember(canonical.get("article_url"), signatures[first])
+
+    if duplicates:
+        print(f"   > 🧬 Collapsed {duplicates} near-duplicate stories into {len(canonicals)} canonicals.")
+    if late:
+        print(f"   > 🧬 Linked {late} stories to near-duplicates stored in earlier batches.")
+    run_metrics.inc("near_duplicates_total", duplicates + late)
+    return canonicals
@@ -1,32 +1,23 @@
-import os
 import json
-import pandas as pd
+import time
 import numpy as np
-import umap
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
-from supabase import create_client, Client, ClientOptions
 from tenacity import retry, stop_after_attempt, wait_exponential
-import httpx
-from textblob import TextBlob
+import config  # noqa: F401
+from metrics import run_metrics
+from clients import get_supabase
+from mirror import READ_FROM_MIRROR, get_mirror
+from alignment import FrameAligner
 
 # --- HISTORY GENERATION ENGINE ---
 # Calculates daily market physics vectors using anchored UMAP projection 
-# and Procrustes alignment for temporal stability.
-
-load_dotenv()
-
-timeout_config = httpx.Timeout(120.0, connect=10.0, read=120.0)
-opts = ClientOptions(postgrest_client_timeout=120)
-
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"), 
-    os.getenv("SUPABASE_SERVICE_KEY"),
-    options=opts
-)
+# and Procrustes alignment (see alignment.py) for temporal stability.
+# pandas, umap and textblob are imported inside the functions that use them.
 
 # Configuration
 HISTORY_DAYS = 90
+RPC_TIMEOUT = 120
+OUTPUT_PATH = "../public/data/market_physics_history.json"
 N_NEIGHBORS = 30     
 MIN_DIST = 0.1       
 METRIC = 'cosine'    
@@ -56,101 +47,85 @@ def normalize_to_bounds(matrix, target_radius=150):
     scale_factor = target_radius / current_radius
     return centered * scale_factor
 
-def align_to_reference(source_matrix, target_matrix, source_tickers, target_tickers):
-    # Identify Common Anchors
-    common_anchors = list(
-        set(source_tickers) & set(target_tickers) & set(ANCHOR_TICKERS)
-    )
-    
-    if len(common_anchors) < 3:
-        common_anchors = list(set(source_tickers) & set(target_tickers))
-    
-    if len(common_anchors) < 3:
-        return target_matrix
-        
-    # Extract Coordinates for Anchors
-    src_indices = [source_tickers.index(t) for t in common_anchors]
-    tgt_indices = [target_tickers.index(t) for t in common_anchors]
-    
-    A_anchors = source_matrix[src_indices]
-    B_anchors = target_matrix[tgt_indices]
-
-    # 3. Calculate centroids based on anchors
-    centroid_A = np.mean(A_anchors, axis=0)
-    centroid_B = np.mean(B_anchors, axis=0)
-
-    # 4. Center anchors
-    AA = A_anchors - centroid_A
-    BB = B_anchors - centroid_B
-
-    # 5. Compute Rotation (SVD) anchors
-    H = np.dot(BB.T, AA)
-    U, S, Vt = np.linalg.svd(H)
-    R = np.dot(U, Vt)
-
-    # Handle reflection (ensure strictly rotation, not mirror image)
-    if np.linalg.det(R) < 0:
-        Vt[1, :] *= -1
-        R = np.dot(U, Vt)
-
-    # Shift the full matrix by the anchor centroid, rotate, then shift back
-    aligned_matrix = np.dot(target_matrix - centroid_B, R) + centroid_A
-    
-    return aligned_matrix
-
-@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=2, max=10))
-def fetch_daily_vectors_rpc(target_date):
+def _vectors_frame(items):
+    """RPC/mirror rows -> DataFrame of ticker, float32 vector, headline and headline sentiment."""
+    import pandas as pd
+    from textblob import TextBlob
     all_records = []
+    for item in items:
+        vec = item['vector']
+        if isinstance(vec, str): vec = json.loads(vec)
+        vec_np = np.array(vec, dtype=np.float32)
+        headline = item.get('headline', '')
+        sentiment = 0
+        if headline:
+            try: sentiment = TextBlob(headline).sentiment.polarity
+            except: sentiment = 0
+        all_records.append({
+            "ticker": item['ticker'],
+            "vector": vec_np,
+            "headline": headline,    
+            "sentiment": sentiment   
+        })
+    return pd.DataFrame(all_records)
+
+@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=2, max=10),
+       before=run_metrics.tenacity_hook("fetch_daily_vectors_rpc"))
+def fetch_daily_rows_rpc(target_date):
+    """Raw get_daily_market_vectors rows for one date, all pages."""
+    supabase = get_supabase(postgrest_timeout=RPC_TIMEOUT)
+    items = []
     page = 0
     page_size = 100
     while True:
         try:
+            t0 = time.perf_counter()
             resp = supabase.rpc("get_daily_market_vectors", {
                 "target_date": target_date,
                 "page_size": page_size,
                 "page_num": page
             }).execute()
+            run_metrics.observe_http("rpc_get_daily_market_vectors", 200, time.perf_counter() - t0)
             if not resp.data: break
-            for item in resp.data:
-                vec = item['vector']
-                if isinstance(vec, str): vec = json.loads(vec)
-                vec_np = np.array(vec, dtype=np.float32)
-                headline = item.get('headline', '')
-                sentiment = 0
-                if headline:
-                    try: sentiment = TextBlob(headline).sentiment.polarity
-                    except: sentiment = 0
-                all_records.append({
-                    "ticker": item['ticker'],
-                    "vector": vec_np,
-                    "headline": headline,    
-                    "sentiment": sentiment   
-                })
+            items.extend(resp.data)
             if len(resp.data) < page_size: break
             page += 1
         except Exception as e:
             print(f"    ⚠️ Error on page {page}: {e}")
             raise e
-    return pd.DataFrame(all_records)
+    return items
+
+def fetch_daily_vectors_rpc(target_date):
+    return _vectors_frame(fetch_daily_rows_rpc(target_date))
+
+def fetch_daily_vectors(target_date):
+    if READ_FROM_MIRROR:
+        return _vectors_frame(get_mirror().daily_market_vectors(target_date))
+    return fetch_daily_vectors_rpc(target_date)
 
 # --- EXECUTION ---
 
-if __name__ == "__main__":
+def generate_history(history_days=HISTORY_DAYS, output_path=OUTPUT_PATH):
+    import umap
+    start_time = time.time()
     print(f"🚀 Starting Stabilized Walk-Forward Generation...")
     
     end_date = datetime.now()
-    dates = [(end_date - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(HISTORY_DAYS)]
+    dates = [(end_date - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(history_days)]
     dates.reverse() 
     
     full_history = []
-    prev_matrix = None
-    prev_tickers = None
+    aligner = FrameAligner(ANCHOR_TICKERS)
     
     for date_str in dates:
         print(f"📅 Processing {date_str}...", end=" ", flush=True)
         
+        day_timings = {"date": date_str}
         try:
-            df = fetch_daily_vectors_rpc(date_str)
+            t0 = time.perf_counter()
+            with run_metrics.phase("fetch"):
+                df = fetch_daily_vectors(date_str)
+            day_timings["fetch_seconds"] = round(time.perf_counter() - t0, 3)
         except Exception as e:
             print(f"\n   ❌ Failed to fetch {date_str}: {e}")
             continue
@@ -166,25 +141,8 @@ if __name__ == "__main__":
             print("Skipped (Not enough data)")
             continue
 
-        # Initialization
-        init_matrix = None
-        
-        if prev_matrix is not None:
-            prev_map = {t: pos for t, pos in zip(prev_tickers, prev_matrix)}
-            init_build = []
-            
-            # Calculate the mean position to use as a fallback for new tickers
-            default_pos = np.mean(prev_matrix, axis=0) 
-            
-            for t in current_tickers:
-                if t in prev_map:
-                    init_build.append(prev_map[t])
-                else:
-                    # Add a tiny bit of noise to the center so they don't stack perfectly
-                    jitter = np.random.normal(0, 1, 2)
-                    init_build.append(default_pos + jitter)
-                    
-            init_matrix = np.array(init_build, dtype=np.float32)
+        # Initialization: start from where each ticker sat in the reference frame(s)
+        init_matrix = aligner.initial_positions(current_tickers)
             
         # Dimensionality Reduction
         reducer = umap.UMAP(
@@ -197,19 +155,19 @@ if __name__ == "__main__":
             n_jobs=1 
         )
         
-        embeddings_raw = reducer.fit_transform(current_matrix)
+        t0 = time.perf_counter()
+        with run_metrics.phase("umap"):
+            embeddings_raw = reducer.fit_transform(current_matrix)
+        day_timings["umap_seconds"] = round(time.perf_counter() - t0, 3)
+        run_metrics.observe("umap_seconds", day_timings["umap_seconds"])
         embeddings_scaled = normalize_to_bounds(embeddings_raw, TARGET_CANVAS_SIZE)
 
         # Procrustes alignment
-        if prev_matrix is not None:
-            embeddings_stabilized = align_to_reference(
-                source_matrix=prev_matrix, 
-                target_matrix=embeddings_scaled,
-                source_tickers=prev_tickers, 
-                target_tickers=current_tickers
-            )
-        else:
-            embeddings_stabilized = embeddings_scaled
+        t0 = time.perf_counter()
+        with run_metrics.phase("align"):
+            embeddings_stabilized = aligner.align(current_tickers, embeddings_scaled)
+        day_timings["align_seconds"] = round(time.perf_counter() - t0, 4)
+        run_metrics.observe("alignment_seconds", day_timings["align_seconds"])
             
         # Save
         for i, row in df.iterrows():
@@ -225,13 +183,20 @@ if __name__ == "__main__":
                 "sentiment": round(row['sentiment'], 2)
             })
             
-        prev_matrix = embeddings_stabilized
-        prev_tickers = current_tickers
+        day_timings["tickers"] = len(df)
+        run_metrics.record("days", day_timings)
+        run_metrics.inc("days_processed_total")
         
         print(f"✅ Aligned & Saved ({len(df)} tickers)")
 
-    output_path = "../public/data/market_physics_history.json"
     with open(output_path, "w") as f:
         json.dump({"data": full_history}, f)
         
-    print(f"\n✨ DONE. Stabilized History saved to {output_path}")
+    print(f"\n✨ DONE. Stabilized History saved to {output_path} in {time.time() - start_time:.2f}s")
+
+
+if __name__ == "__main__":
+    run_metrics.begin("history")
+    generate_history()
+    run_metrics.print_phase_table()
+    run_metrics.write_report()
@@ -0,0 +1,68 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- SHARED HTTP CLIENT ---
+# One pooled, keep-alive client per process for all outbound API traffic.
+# Bulk jobs fan out over 10-20 worker threads; sizing the pool to the worker
+# count means every thread reuses a warm TLS connection instead of paying a
+# fresh handshake per ticker/page.
+#
+# Set HTTP_CLIENT_HTTP2=1 to use httpx with HTTP/2 multiplexing (needs the
+# optional `h2` package); otherwise a requests.Session is used. The flag is
+# read when the client is first built, so a .env loaded after import counts.
+
+DEFAULT_POOL_SIZE = 20
+DEFAULT_HEADERS = {
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+    "User-Agent": "catincloud-backend/1.0"
+}
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _build_requests_session(pool_size):
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _build_httpx_client(pool_size):
+    try:
+        import httpx
+        import h2  # noqa: F401
+    except ImportError:
+        print("   > ⚠️ HTTP_CLIENT_HTTP2=1 but `httpx`/`h2` is not installed. Falling back to requests.")
+        return None
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size, keepalive_expiry=60)
+    return httpx.Client(http2=True, limits=limits, headers=DEFAULT_HEADERS, follow_redirects=True)
+
+
+def get_http_client(pool_size=DEFAULT_POOL_SIZE):
+    """
+    Returns the process-wide HTTP client, creating it on first use.
+    Both backends expose `.get(url, timeout=...)` returning a response with
+    `.status_code`, `.headers` and `.json()`, which is all the jobs rely on.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            if os.getenv("HTTP_CLIENT_HTTP2", "0") == "1":
+                _client = _build_httpx_client(pool_size)
+            if _client is None:
+                _client = _build_requests_session(pool_size)
+        return _client
+
+
+def close_http_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
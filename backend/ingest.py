@@ -1,33 +1,31 @@
 import os
-import requests
+import json
 import time
 import concurrent.futures
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
-from supabase import create_client, Client
-from openai import OpenAI
 from tenacity import retry, wait_random_exponential, stop_after_attempt
-import networkx as nx
-import community as community_louvain  # python-louvain
+import config  # noqa: F401
+from metrics import run_metrics
+from rate_limiter import polygon_get
+from http_client import get_http_client
+from clients import get_supabase, get_openai, get_db_writer, close_clients
+from batch_writer import AdaptiveBatchWriter, NewsGraphWriter
+from news_firehose import fetch_news_since, load_cursor, save_cursor, hold_cursor
+from dedup import DedupIndex, dedupe_articles, duplicate_edges, DUPLICATE_EDGE_TYPE
+from similarity import SimilarityLinker, load_recent_vectors, SIMILARITY_SEED_SIZE
+from mirror import READ_FROM_MIRROR, get_mirror
 
 # --- CONFIGURATION & SETUP ---
-load_dotenv()
+# Clients and the heavier analytics modules (networkx, python-louvain,
+# pandas) load on first use, so each phase can run on its own from cli.py.
 MASSIVE_KEY = os.getenv("MASSIVE_API_KEY")
 MASSIVE_BASE_URL = "https://api.polygon.io" 
 
-session = requests.Session()
-adapter = requests.adapters.HTTPAdapter(pool_connections=20, pool_maxsize=20)
-session.mount('https://', adapter)
-
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_KEY")
-)
-
 MAX_WORKERS = 10 
 NEWS_LOOKBACK_LIMIT = 3
-DB_BATCH_SIZE = 25 
+NEWS_SOURCE = os.getenv("NEWS_SOURCE", "per_ticker")  # 'per_ticker' or 'firehose'
+COMMUNITY_SOURCE = os.getenv("COMMUNITY_SOURCE", "news")  # 'news', 'price' or 'blend'
+NEWS_SPOOL_PATH = os.getenv("NEWS_SPOOL_PATH", "state/news_spool.json")
 
 ANCHOR_TICKERS = [
     "SPY", "QQQ", "IWM", "DIA",       
@@ -103,8 +101,11 @@ TICKER_UNIVERSE = list(set(MANUAL_TICKERS + ANCHOR_TICKERS))
 
 # --- CLASS: COMMUNITY DETECTOR ---
 class CommunityDetector:
-    def __init__(self, supabase_client):
+    def __init__(self, supabase_client, writer=None):
+        import networkx as nx
+        from db_writer import make_db_writer
         self.supabase = supabase_client
+        self.writer = writer or make_db_writer(supabase_client)
         self.graph = nx.Graph()
 
     def fetch_and_build(self):
@@ -115,10 +116,13 @@ class CommunityDetector:
         # We only want 'MENTIONS' edges from the last 7 days to keep it relevant
         try:
             # Note: You might need to adjust this query depending on your exact schema volume
-            response = self.supabase.table('knowledge_graph')\
-                .select("*").eq('edge_type', 'MENTIONS').execute()
+            with run_metrics.phase("communities.fetch_edges"):
+                if READ_FROM_MIRROR:
+                    edges = get_mirror().edges('MENTIONS')
+                else:
+                    edges = self.supabase.table('knowledge_graph')\
+                        .select("*").eq('edge_type', 'MENTIONS').execute().data
             
-            edges = response.data
             if not edges:
                 print("   > ⚠️ No edges found. Skipping detection.")
                 return
@@ -138,22 +142,22 @@ class CommunityDetector:
         except Exception as e:
             print(f"   > ❌ Graph Build Error: {e}")
 
-    def run_detection(self):
-        """Runs Louvain Algorithm and PageRank to label communities."""
+    def project_news_graph(self):
+        """Projects the bipartite News <-> Ticker graph to Ticker <-> Ticker co-mentions."""
+        import networkx as nx
+        projected_graph = nx.Graph()
         if self.graph.number_of_nodes() == 0:
-            return
+            return projected_graph
 
         # 1. Project to Ticker-Only Graph
         # Currently the graph is Mixed (News IDs + Ticker Strings)
         # We need to filter for Ticker nodes only.
-        ticker_nodes = [n for n in self.graph.nodes() if isinstance(n, str) and n.isupper() and len(n) < 6]
+        ticker_nodes = {n for n in self.graph.nodes() if isinstance(n, str) and n.isupper() and len(n) < 6}
         
         if len(ticker_nodes) < 2: 
-            return
+            return projected_graph
 
         # Create a projection: Two tickers are connected if they share a News Article
-        projected_graph = nx.Graph()
-        
         # (This is a simplified projection for speed)
         # Iterate all news nodes (numeric IDs usually)
         news_nodes = [n for n in self.graph.nodes() if n not in ticker_nodes]
@@ -171,6 +175,29 @@ class CommunityDetector:
                             projected_graph.add_edge(t1, t2, weight=1)
 
         print(f"   > 🧮 Projected Graph: {projected_graph.number_of_nodes()} Tickers, {projected_graph.number_of_edges()} Links")
+        return projected_graph
+
+    def build_correlation_graph(self):
+        """Ticker <-> Ticker graph from rolling return correlations in stocks_ohlc."""
+        from correlation_graph import load_close_matrix, build_price_graph
+        print("   > 📈 Loading close matrix for correlation clustering...")
+        with run_metrics.phase("communities.fetch_closes"):
+            mirror = get_mirror() if READ_FROM_MIRROR else None
+            _, tickers, closes = load_close_matrix(self.supabase, TICKER_UNIVERSE, mirror=mirror)
+        return build_price_graph(tickers, closes)
+
+    def run_detection(self, source=COMMUNITY_SOURCE):
+        """Runs Louvain Algorithm and PageRank to label communities."""
+        import networkx as nx
+        import community as community_louvain  # python-louvain
+        from correlation_graph import blend_graphs
+        if source == "price":
+            projected_graph = self.build_correlation_graph()
+        elif source == "blend":
+            projected_graph = blend_graphs(self.project_news_graph(), self.build_correlation_graph())
+            print(f"   > 🔀 Blended Graph: {projected_graph.number_of_nodes()} Tickers, {projected_graph.number_of_edges()} Links")
+        else:
+            projected_graph = self.project_news_graph()
 
         if projected_graph.number_of_nodes() == 0:
             return
@@ -214,64 +241,50 @@ class CommunityDetector:
         if updates:
             print(f"   > 💾 Saving {len(updates)} community classifications...")
             # We use upsert. Since (ticker, date) is unique, this updates the row.
-            try:
-                # Chunking for safety
-                batch_size = 50
-                for i in range(0, len(updates), batch_size):
-                    batch = updates[i:i+batch_size]
-                    self.supabase.table("stocks_ohlc").upsert(batch, on_conflict="ticker,date").execute()
-            except Exception as e:
-                print(f"   > ❌ Save Error: {e}")
+            community_writer = AdaptiveBatchWriter(self.writer, "stocks_ohlc", on_conflict="ticker,date")
+            community_writer.extend(updates)
+            community_writer.close()
+            if community_writer.rows_failed:
+                print(f"   > ❌ Save Error: {community_writer.rows_failed} classifications not saved.")
 
 
 # --- HELPER FUNCTIONS (UNCHANGED) ---
-@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6),
+       before=run_metrics.tenacity_hook("get_embedding"))
 def get_embedding(text):
     text = text.replace("\n", " ")
-    return openai_client.embeddings.create(input=[text], model="text-embedding-3-small").data[0].embedding
-
-def upload_stock_batch(records):
-    if not records: return
-    try:
-        supabase.table("stocks_ohlc").upsert(records, on_conflict="ticker,date").execute()
-        print(f" 💾 Stocks DB Commit: Saved {len(records)} tickers.")
-    except Exception as e:
-        print(f" ❌ Stocks DB Error: {e}")
+    response = get_openai().embeddings.create(input=[text], model="text-embedding-3-small")
+    run_metrics.observe_embedding(response)
+    return response.data[0].embedding
 
 def fetch_single_stock(ticker):
     yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
     url = f"{MASSIVE_BASE_URL}/v1/open-close/{ticker}/{yesterday}?adjusted=true&apiKey={MASSIVE_KEY}"
-    attempts = 0
-    while attempts < 3:
-        try:
-            resp = session.get(url, timeout=10)
-            if resp.status_code == 429:
-                time.sleep(2)
-                attempts += 1
-                continue
-            if resp.status_code != 200: return None
-            data = resp.json()
-            return {
-                "ticker": data.get("symbol"),
-                "date": data.get("from"),
-                "open": data.get("open"),
-                "high": data.get("high"),
-                "low": data.get("low"),
-                "close": data.get("close"),
-                "volume": data.get("volume")
-            }
-        except Exception:
-            return None
-    return None
+    try:
+        resp = polygon_get(get_http_client(MAX_WORKERS), url, "open-close", timeout=10)
+        if resp.status_code != 200: return None
+        data = resp.json()
+        return {
+            "ticker": data.get("symbol"),
+            "date": data.get("from"),
+            "open": data.get("open"),
+            "high": data.get("high"),
+            "low": data.get("low"),
+            "close": data.get("close"),
+            "volume": data.get("volume")
+        }
+    except Exception as e:
+        print(f" ❌ OHLC fetch failed for {ticker}: {e}")
+        return None
 
 def fetch_ticker_news(ticker):
     url = f"{MASSIVE_BASE_URL}/v2/reference/news?ticker={ticker}&limit={NEWS_LOOKBACK_LIMIT}&apiKey={MASSIVE_KEY}"
     try:
-        resp = session.get(url, timeout=10)
+        resp = polygon_get(get_http_client(MAX_WORKERS), url, "news", timeout=10)
         if resp.status_code == 200:
             return resp.json().get("results", [])
-    except Exception:
-        pass
+    except Exception as e:
+        print(f" ❌ News fetch failed for {ticker}: {e}")
     return []
 
 def process_article_embedding(article):
@@ -296,49 +309,23 @@ def process_article_embedding(article):
                 "target_node": t,
                 "weight": 1.0
             })
+        # Near-duplicates reuse this vector; link them instead of embedding again
+        for dup_url in article.get("duplicate_urls", []):
+            edge_stubs.append({
+                "source_url": article_url,
+                "target_node": dup_url,
+                "edge_type": DUPLICATE_EDGE_TYPE,
+                "weight": 1.0
+            })
         return vector_record, edge_stubs
     except Exception as e:
-        return None, []
-
-@retry(stop=stop_after_attempt(5), wait=wait_random_exponential(min=2, max=10))
-def upload_news_batch(vectors, edges):
-    if not vectors: return
-    res = supabase.table("news_vectors").upsert(vectors, on_conflict="url").execute()
-    if res.data:
-        url_to_id = {item['url']: item['id'] for item in res.data}
-        final_edges = []
-        for stub in edges:
-            article_id = url_to_id.get(stub['source_url'])
-            if article_id:
-                final_edges.append({
-                    "source_node": str(article_id),
-                    "target_node": stub['target_node'],
-                    "edge_type": "MENTIONS",
-                    "weight": stub['weight']
-                })
-        if final_edges:
-            supabase.table("knowledge_graph").upsert(final_edges, on_conflict="source_node,target_node,edge_type", ignore_duplicates=True).execute()
-
-# --- MAIN EXECUTION ---
-if __name__ == "__main__":
-    start_time = time.time()
-    print(f"🚀 Starting Engine for {len(TICKER_UNIVERSE)} Tickers...")
-    
-    # 1. Stocks
-    print("\n📊 Phase 1: Fetching Market Physics (OHLC)...")
-    valid_records = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_ticker = {executor.submit(fetch_single_stock, t): t for t in TICKER_UNIVERSE}
-        for future in concurrent.futures.as_completed(future_to_ticker):
-            result = future.result()
-            if result: valid_records.append(result)
-
-    for i in range(0, len(valid_records), DB_BATCH_SIZE):
-        upload_stock_batch(valid_records[i:i + DB_BATCH_SIZE])
+        # (None, None) marks a failure to retry, unlike (None, []) for a skipped stub
+        print(f" ❌ Embedding failed for {article_url}: {str(e)[:100]}")
+        return None, None
 
-    # 2. News
-    print("\n🧠 Phase 2: Targeted Knowledge Ingestion...")
-    unique_articles = {} 
+def fetch_news_per_ticker():
+    """Fan-out mode: NEWS_LOOKBACK_LIMIT stories per ticker, deduped by URL."""
+    unique_articles = {}
     print(f"   > Scouting news for {len(TICKER_UNIVERSE)} targets...")
     with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
         future_to_ticker = {executor.submit(fetch_ticker_news, t): t for t in TICKER_UNIVERSE}
@@ -347,47 +334,185 @@ if __name__ == "__main__":
             for art in articles:
                 if art.get('article_url'):
                     unique_articles[art['article_url']] = art
-
-    print(f"   > Found {len(unique_articles)} unique relevant stories.")
+    return list(unique_articles.values())
+
+_similarity_linker = None
+
+def get_similarity_linker(warm_remote=False):
+    """
+    One linker per process, warmed once with recent vectors; its window then rolls forward.
+    The seed comes from the local mirror with READ_FROM_MIRROR=1. Downloading it over
+    PostgREST costs more than a short cron run saves, so only long-lived callers
+    (`warm_remote`, e.g. the poller) do that; otherwise the window starts cold and new
+    stories are scored against each other. SIMILARITY_SEED_SIZE=0 never warms.
+    """
+    global _similarity_linker
+    if _similarity_linker is None:
+        _similarity_linker = SimilarityLinker(get_db_writer())
+        if SIMILARITY_SEED_SIZE <= 0 or not (READ_FROM_MIRROR or warm_remote):
+            print("   > 🧲 Similarity window starts cold.")
+            return _similarity_linker
+        try:
+            if READ_FROM_MIRROR:
+                ids, vectors = get_mirror().recent_vectors(SIMILARITY_SEED_SIZE)
+            else:
+                ids, vectors = load_recent_vectors(get_supabase())
+            _similarity_linker.seed(ids, vectors)
+            print(f"   > 🧲 Similarity window warmed with {len(ids)} recent articles.")
+        except Exception as e:
+            print(f"   > ⚠️ Could not warm similarity window: {e}")
+    return _similarity_linker
+
+# Lives as long as the process, so the firehose poller links copies across polls.
+_dedup_index = DedupIndex()
+
+def embed_and_store_articles(articles, warm_similarity=False):
+    """
+    Embeds articles and writes vectors + MENTIONS edges. Uploads overlap with embedding.
+    Copies of stories stored by an earlier batch are only linked, not embedded.
+    `warm_similarity` is passed on to get_similarity_linker as `warm_remote`.
+    Returns the (canonical) articles that could not be embedded or fully stored.
+    """
+    with run_metrics.phase("dedupe"):
+        articles = dedupe_articles(articles, index=_dedup_index)
     print(f"   > Processing Embeddings & Graph Edges...")
-
-    page_vectors = []
-    page_edges = []
+    similarity = get_similarity_linker(warm_remote=warm_similarity)
+    news_writer = NewsGraphWriter(get_db_writer(), on_stored=similarity.add, dedup_index=_dedup_index)
     processed_count = 0
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = list(executor.map(process_article_embedding, unique_articles.values()))
-        
-        for vec, edges in futures:
-            if vec:
-                page_vectors.append(vec)
-                page_edges.extend(edges)
-            
-            if len(page_vectors) >= DB_BATCH_SIZE:
-                try:
-                    upload_news_batch(page_vectors, page_edges)
-                    processed_count += len(page_vectors)
-                    print(f"     ... processed {processed_count}/{len(unique_articles)}")
-                except Exception as e:
-                    print(f" ❌ Skipping batch due to persistent error: {e}")
-                
-                # RESET
-                page_vectors = []
-                page_edges = []
-                time.sleep(0.5)
+    failed = []
 
-        if page_vectors:
+    for article in articles:
+        if "duplicate_of" in article:
+            news_writer.add_edges(duplicate_edges(article, article["duplicate_of"]), article["article_url"])
+    to_embed = [a for a in articles if "duplicate_of" not in a]
+    
+    with run_metrics.phase("embed"):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for article, (vec, edges) in zip(to_embed, executor.map(process_article_embedding, to_embed)):
+                if edges is None:
+                    failed.append(article)
+                elif vec:
+                    news_writer.add(vec, edges)
+                    processed_count += 1
+                    if processed_count % 100 == 0:
+                        print(f"     ... embedded {processed_count}/{len(to_embed)}")
+
+        with run_metrics.phase("embed.upload"):
+            vectors_saved, edges_saved = news_writer.close()
+            similar_saved = similarity.flush()
+        print(f"     ... saved {vectors_saved}/{len(to_embed)} stories, {edges_saved} graph edges, {similar_saved} similarity links")
+
+    failed.extend(a for a in articles if a.get("article_url") in news_writer.failed_urls)
+    if failed:
+        print(f"   > ⚠️ {len(failed)} stories were not fully stored and will be retried.")
+        run_metrics.inc("articles_failed_total", len(failed))
+    return failed
+
+# --- PHASES ---
+# Each phase stands alone so cli.py can run just the one cron says is due;
+# `python ingest.py` still runs them all in order.
+
+def run_ohlc_phase():
+    print(f"\n📊 Phase 1: Fetching Market Physics (OHLC) for {len(TICKER_UNIVERSE)} Tickers...")
+    valid_records = []
+    with run_metrics.phase("ohlc"):
+        with run_metrics.phase("ohlc.fetch"):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                future_to_ticker = {executor.submit(fetch_single_stock, t): t for t in TICKER_UNIVERSE}
+                for future in concurrent.futures.as_completed(future_to_ticker):
+                    result = future.result()
+                    if result: valid_records.append(result)
+
+        with run_metrics.phase("ohlc.upload"):
+            stock_writer = AdaptiveBatchWriter(get_db_writer(), "stocks_ohlc", on_conflict="ticker,date")
+            stock_writer.extend(valid_records)
+            stock_writer.close()
+            print(f" 💾 Stocks DB Commit: Saved {stock_writer.rows_written} tickers.")
+
+
+def fetch_news_phase(cursor=None):
+    """Returns (articles, next_cursor); next_cursor is None outside firehose mode."""
+    print("\n🧠 Phase 2: Targeted Knowledge Ingestion...")
+    next_cursor = None
+    with run_metrics.phase("news"), run_metrics.phase("news.fetch"):
+        if NEWS_SOURCE == "firehose":
+            cursor = cursor or load_cursor()
+            print(f"   > Reading market-wide feed since {cursor['published_utc']}...")
             try:
-                upload_news_batch(page_vectors, page_edges)
-                print(f"     ... processed {len(unique_articles)}/{len(unique_articles)}")
+                articles, next_cursor = fetch_news_since(get_http_client(MAX_WORKERS), MASSIVE_KEY, cursor, TICKER_UNIVERSE)
             except Exception as e:
-                print(f" ❌ Error uploading final batch: {e}")
+                # No next_cursor, so the saved cursor stays put and the window is retried next run.
+                print(f" ❌ Firehose fetch failed: {e}")
+                articles = []
+        else:
+            articles = fetch_news_per_ticker()
+
+    print(f"   > Found {len(articles)} unique relevant stories.")
+    return articles, next_cursor
+
+
+def run_embed_phase(articles, next_cursor=None):
+    """Stores articles, then advances the firehose cursor no further than the first failure."""
+    failed = embed_and_store_articles(articles)
+    if next_cursor:
+        save_cursor(hold_cursor(next_cursor, failed))
+    return failed
+
 
-    # 3. Community Detection (NEW)
+def load_news_spool(path=NEWS_SPOOL_PATH):
+    """Articles fetched by `cli.py news` that `cli.py embed` has not stored yet."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"articles": [], "next_cursor": None}
+
+
+def spool_news(articles, next_cursor, path=NEWS_SPOOL_PATH):
+    """Merges fetched articles into the spool by URL; the firehose cursor rides along."""
+    spool = load_news_spool(path)
+    merged = {a["article_url"]: a for a in spool["articles"]}
+    merged.update((a["article_url"], a) for a in articles)
+    spool = {"articles": list(merged.values()), "next_cursor": next_cursor or spool["next_cursor"]}
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(spool, f)
+    os.replace(tmp_path, path)
+    print(f"   > 📥 Spooled {len(spool['articles'])} stories for the embed phase.")
+
+
+def clear_news_spool(path=NEWS_SPOOL_PATH):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def run_community_phase(source=None):
+    source = source or COMMUNITY_SOURCE
     print("\n🕸️ Phase 3: Mathematical Clustering (Bubble Detection)...")
-    detector = CommunityDetector(supabase)
-    detector.fetch_and_build()
-    detector.run_detection()
+    with run_metrics.phase("communities"):
+        detector = CommunityDetector(get_supabase(), get_db_writer())
+        if source != "price":
+            detector.fetch_and_build()
+        detector.run_detection(source)
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    start_time = time.time()
+    run_metrics.begin("ingest")
+    print(f"🚀 Starting Engine for {len(TICKER_UNIVERSE)} Tickers...")
+
+    run_ohlc_phase()
+    articles, next_cursor = fetch_news_phase()
+    run_embed_phase(articles, next_cursor)
+    run_community_phase()
 
     duration = time.time() - start_time
     print(f"\n✨ SYSTEM UPDATE COMPLETE in {duration:.2f} seconds.")
+    close_clients()
+    run_metrics.print_phase_table()
+    run_metrics.write_report()
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import config  # noqa: F401
+
+# --- RUN METRICS ---
+# Lightweight instrumentation shared by the backend jobs.
+# Collects phase wall times, counters and latency histograms in-process,
+# then writes a JSON run report plus a Prometheus textfile at the end of a run.
+
+METRICS_DIR = os.getenv("METRICS_DIR", "run_reports")
+METRIC_PREFIX = "catincloud"
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = (1, 10, 25, 50, 100, 200, 500, 1000, 5000)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(pairs):
+    if not pairs: return ""
+    body = ",".join(f'{k}="{v}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        running = 0
+        out = []
+        for bound, n in zip(self.buckets, self.counts):
+            running += n
+            out.append((bound, running))
+        return out
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 4),
+            "mean": round(self.sum / self.count, 4) if self.count else 0.0,
+            "max": round(self.max, 4),
+            "buckets": {str(b): n for b, n in self.cumulative()}
+        }
+
+
+class RunMetrics:
+    def __init__(self, job="backend"):
+        self.job = job
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self.phases = {}
+        self.counters = {}
+        self.histograms = {}
+        self.records = {}
+
+    def begin(self, job):
+        """Resets the collector and tags every series with the job name."""
+        with self._lock:
+            self.job = job
+            self.started_at = time.time()
+            self.phases.clear()
+            self.counters.clear()
+            self.histograms.clear()
+            self.records.clear()
+
+    @contextmanager
+    def phase(self, name):
+        """Times a phase or stage. Nested stages use dotted names, e.g. 'news.embed'."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    def record(self, section, entry):
+        """Appends a free-form row (e.g. per-day timings) to the JSON report."""
+        with self._lock:
+            self.records.setdefault(section, []).append(entry)
+
+    # --- DOMAIN HELPERS ---
+
+    def observe_http(self, endpoint, status, seconds):
+        self.observe("http_request_seconds", seconds, endpoint=endpoint)
+        self.inc("http_requests_total", endpoint=endpoint, status=status)
+        if status == 429:
+            self.inc("http_429_total", endpoint=endpoint)
+
+    def observe_upsert(self, table, row_count, payload_bytes, seconds):
+        """`payload_bytes` comes from the writer; re-serializing the rows here would cost as much as the upload."""
+        self.observe("db_upsert_seconds", seconds, table=table)
+        self.observe("db_upsert_rows", row_count, buckets=SIZE_BUCKETS, table=table)
+        self.inc("db_rows_total", row_count, table=table)
+        self.inc("db_bytes_total", payload_bytes, table=table)
+
+    def observe_embedding(self, response):
+        self.inc("embedding_requests_total")
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.inc("embedding_tokens_total", getattr(usage, "total_tokens", 0) or 0)
+
+    def tenacity_hook(self, fn_name):
+        """Returns a tenacity `before` callback counting attempts and retries."""
+        def _before(retry_state):
+            self.inc("tenacity_attempts_total", fn=fn_name)
+            if retry_state.attempt_number > 1:
+                self.inc("retries_total", fn=fn_name)
+        return _before
+
+    # --- EXPORT ---
+
+    def snapshot(self):
+        with self._lock:
+            counters = {}
+            for (name, labels), value in self.counters.items():
+                counters.setdefault(name, []).append({"labels": dict(labels), "value": value})
+            histograms = {}
+            for (name, labels), hist in self.histograms.items():
+                histograms.setdefault(name, []).append({"labels": dict(labels), **hist.summary()})
+            return {
+                "job": self.job,
+                "started_at": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+                "duration_seconds": round(time.time() - self.started_at, 3),
+                "phases": {k: round(v, 3) for k, v in self.phases.items()},
+                "counters": counters,
+                "histograms": histograms,
+                "records": {k: list(v) for k, v in self.records.items()}
+            }
+
+    def to_prometheus(self):
+        job = ("job", self.job)
+        lines = []
+        with self._lock:
+            lines.append(f"# TYPE {METRIC_PREFIX}_run_duration_seconds gauge")
+            lines.append(f"{METRIC_PREFIX}_run_duration_seconds{_format_labels([job])} {time.time() - self.started_at:.3f}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_run_timestamp_seconds gauge")
+            lines.append(f"{METRIC_PREFIX}_run_timestamp_seconds{_format_labels([job])} {self.started_at:.0f}")
+
+            lines.append(f"# TYPE {METRIC_PREFIX}_phase_seconds gauge")
+            for phase, seconds in sorted(self.phases.items()):
+                lines.append(f"{METRIC_PREFIX}_phase_seconds{_format_labels([job, ('phase', phase)])} {seconds:.4f}")
+
+            for name in sorted({n for n, _ in self.counters}):
+                metric = f"{METRIC_PREFIX}_{name}"
+                lines.append(f"# TYPE {metric} counter")
+                for (n, labels), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f"{metric}{_format_labels([job, *labels])} {value}")
+
+            for name in sorted({n for n, _ in self.histograms}):
+                metric = f"{METRIC_PREFIX}_{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                for (n, labels), hist in sorted(self.histograms.items(), key=lambda kv: kv[0]):
+                    if n != name: continue
+                    base = [job, *labels]
+                    for bound, running in hist.cumulative():
+                        lines.append(f"{metric}_bucket{_format_labels([*base, ('le', bound)])} {running}")
+                    lines.append(f"{metric}_bucket{_format_labels([*base, ('le', '+Inf')])} {hist.count}")
+                    lines.append(f"{metric}_sum{_format_labels(base)} {hist.sum:.4f}")
+                    lines.append(f"{metric}_count{_format_labels(base)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, out_dir=None):
+        """Writes <job>.json and <job>.prom (atomic rename, safe for node_exporter's textfile collector)."""
+        out_dir = out_dir or METRICS_DIR
+        os.makedirs(out_dir, exist_ok=True)
+        json_path = os.path.join(out_dir, f"{self.job}.json")
+        prom_path = os.path.join(out_dir, f"{self.job}.prom")
+
+        for path, body in ((json_path, json.dumps(self.snapshot(), indent=2)), (prom_path, self.to_prometheus())):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+
+        print(f"📈 Run report written to {json_path} and {prom_path}")
+        return json_path, prom_path
+
+    def print_phase_table(self):
+        if not self.phases: return
+        total = sum(v for k, v in self.phases.items() if "." not in k) or 1.0
+        print("\n⏱️ Phase timings:")
+        for phase, seconds in self.phases.items():
+            share = f"{seconds / total * 100:5.1f}%" if "." not in phase else "      "
+            print(f"   {phase:<28} {seconds:8.2f}s {share}")
+
+
+run_metrics = RunMetrics()
@@ -0,0 +1,337 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import numpy as np
+from datetime import datetime, timedelta
+from metrics import run_metrics
+from similarity import SIMILAR_EDGE_TYPE
+
+# --- LOCAL ANALYTICAL MIRROR ---
+# A read-only SQLite copy of stocks_ohlc, news_vectors and knowledge_graph
+# for the batch jobs that re-read the same mostly-unchanged rows every run
+# (generate_history's 90 daily RPC loops, CommunityDetector's full edge
+# scan). Each sync re-reads only a trailing window behind a per-table
+# high-water mark and upserts what changed locally; reads then run at
+# local-disk speed.
+#
+# news_vectors ids are allocated before their batch commits, so concurrent
+# writers can land ids below the watermark after a sync has passed them, and
+# re-upserts (DO UPDATE) keep the old id. Each sync therefore re-reads the
+# last MIRROR_ID_OVERLAP ids as (id, url, headline, published_at) and only
+# fetches embeddings for rows that are new or differ locally.
+#
+# knowledge_graph has no usable sync column, but every edge starts at a
+# news_vectors id, so it is synced by source_node over the same trailing
+# window of local news ids. SIMILAR_TO edges are always written in both
+# directions with the same score, so the reverse of each one is filled in
+# locally.
+#
+# Embeddings are stored as raw float32 blobs and decoded with
+# np.frombuffer, so a day's vectors load straight into a matrix.
+#
+# Enable the reads with READ_FROM_MIRROR=1. `python cli.py sync-mirror`
+# syncs on its own; reading jobs sync incrementally first unless
+# MIRROR_AUTO_SYNC=0. `python check_mirror.py --date YYYY-MM-DD` compares
+# the mirror's daily vectors with the get_daily_market_vectors RPC.
+
+MIRROR_PATH = os.getenv("MIRROR_PATH", "state/mirror.sqlite3")
+READ_FROM_MIRROR = os.getenv("READ_FROM_MIRROR", "0") == "1"
+MIRROR_AUTO_SYNC = os.getenv("MIRROR_AUTO_SYNC", "1") == "1"
+MIRROR_PAGE_SIZE = 1000
+MIRROR_ID_CHUNK = 100
+# Community labels are written onto recent stocks_ohlc rows after the bars
+# land, so the date watermark re-reads a short trailing window.
+MIRROR_OHLC_OVERLAP_DAYS = int(os.getenv("MIRROR_OHLC_OVERLAP_DAYS", "7"))
+# Ids behind the news watermark re-checked on each sync; covers batches
+# still in flight from concurrent writers when the last sync ran.
+MIRROR_ID_OVERLAP = int(os.getenv("MIRROR_ID_OVERLAP", "2000"))
+# Bump when SCHEMA changes; an older mirror file is rebuilt from scratch.
+MIRROR_SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stocks_ohlc (
+    ticker TEXT NOT NULL,
+    date TEXT NOT NULL,
+    open REAL, high REAL, low REAL, close REAL, volume REAL,
+    community_id INTEGER,
+    community_label TEXT,
+    PRIMARY KEY (ticker, date)
+);
+CREATE INDEX IF NOT EXISTS stocks_ohlc_date ON stocks_ohlc (date);
+
+CREATE TABLE IF NOT EXISTS news_vectors (
+    id INTEGER PRIMARY KEY,
+    url TEXT,
+    headline TEXT,
+    published_at TEXT,
+    published_date TEXT,
+    embedding BLOB
+);
+CREATE INDEX IF NOT EXISTS news_vectors_day ON news_vectors (published_date);
+
+CREATE TABLE IF NOT EXISTS knowledge_graph (
+    source_node TEXT NOT NULL,
+    target_node TEXT NOT NULL,
+    edge_type TEXT NOT NULL,
+    weight REAL,
+    PRIMARY KEY (source_node, target_node, edge_type)
+);
+CREATE INDEX IF NOT EXISTS knowledge_graph_type ON knowledge_graph (edge_type, source_node);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    table_name TEXT PRIMARY KEY,
+    watermark TEXT,
+    synced_at TEXT
+);
+"""
+
+# Synced in this order: knowledge_graph follows the local news_vectors ids.
+SYNC_TABLES = ("stocks_ohlc", "news_vectors", "knowledge_graph")
+
+OHLC_COLUMNS = "ticker, date, open, high, low, close, volume, community_id, community_label"
+NEWS_KEY_COLUMNS = "id, url, headline, published_at"
+NEWS_COLUMNS = "id, url, headline, published_at, embedding"
+EDGE_COLUMNS = "source_node, target_node, edge_type, weight"
+EDGE_KEY = ("source_node", "target_node", "edge_type")
+
+
+def _encode_vector(vec):
+    if isinstance(vec, str): vec = json.loads(vec)
+    return np.asarray(vec, dtype=np.float32).tobytes()
+
+
+def _to_local_row(table, row):
+    if table == "stocks_ohlc":
+        return (row["ticker"], row["date"], row.get("open"), row.get("high"), row.get("low"),
+                row.get("close"), row.get("volume"), row.get("community_id"), row.get("community_label"))
+    if table == "news_vectors":
+        published = row.get("published_at") or ""
+        return (row["id"], row.get("url"), row.get("headline"), published, published[:10],
+                _encode_vector(row["embedding"]))
+    return (str(row["source_node"]), str(row["target_node"]), row["edge_type"], row.get("weight"))
+
+
+_UPSERT_SQL = {
+    "stocks_ohlc": "INSERT OR REPLACE INTO stocks_ohlc VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+    "news_vectors": "INSERT OR REPLACE INTO news_vectors VALUES (?, ?, ?, ?, ?, ?)",
+    "knowledge_graph": "INSERT OR REPLACE INTO knowledge_graph VALUES (?, ?, ?, ?)",
+}
+
+
+def _pages(make_query):
+    """Offset-pages a PostgREST query; `make_query` must apply a total order."""
+    offset = 0
+    while True:
+        data = make_query().range(offset, offset + MIRROR_PAGE_SIZE - 1).execute().data
+        if data: yield data
+        if len(data) < MIRROR_PAGE_SIZE: return
+        offset += MIRROR_PAGE_SIZE
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class AnalyticsMirror:
+    def __init__(self, path=MIRROR_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != MIRROR_SCHEMA_VERSION:
+            # The mirror is only a cache, so an old layout is dropped and resynced.
+            with self.conn:
+                for table in (*SYNC_TABLES, "sync_state"):
+                    self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+                self.conn.execute(f"PRAGMA user_version = {MIRROR_SCHEMA_VERSION}")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.conn.close()
+
+    # --- SYNC ---
+
+    def watermark(self, table):
+        row = self.conn.execute("SELECT watermark FROM sync_state WHERE table_name = ?", (table,)).fetchone()
+        return row[0] if row else None
+
+    def _set_watermark(self, table, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)",
+            (table, str(value), datetime.now().isoformat(timespec="seconds"))
+        )
+
+    def sync(self, supabase_client, tables=None, full=False):
+        """Re-reads each table's trailing window and applies changes. Returns {table: rows_synced}."""
+        synced = {}
+        for table in [t for t in SYNC_TABLES if t in (tables or SYNC_TABLES)]:
+            with run_metrics.phase(f"mirror.sync.{table}"):
+                if full:
+                    with self._lock, self.conn:
+                        self.conn.execute(f"DELETE FROM {table}")
+                        self.conn.execute("DELETE FROM sync_state WHERE table_name = ?", (table,))
+                synced[table] = getattr(self, f"_sync_{table}")(supabase_client)
+            run_metrics.inc("mirror_rows_synced_total", synced[table], table=table)
+        print(f"   > 🪞 Mirror synced: {', '.join(f'{t} +{n}' for t, n in synced.items())}")
+        return synced
+
+    def _sync_stocks_ohlc(self, supabase_client):
+        last = self.watermark("stocks_ohlc")
+        high = last
+        total = 0
+
+        def query():
+            q = supabase_client.table("stocks_ohlc").select(OHLC_COLUMNS)
+            if last is not None:
+                since = datetime.strptime(last, "%Y-%m-%d") - timedelta(days=MIRROR_OHLC_OVERLAP_DAYS)
+                q = q.gte("date", since.strftime("%Y-%m-%d"))
+            return q.order("date").order("ticker")
+
+        for rows in _pages(query):
+            high = max(high or "", rows[-1]["date"])
+            self._apply("stocks_ohlc", rows, high)
+            total += len(rows)
+        return total
+
+    def _sync_news_vectors(self, supabase_client):
+        last = self.watermark("news_vectors")
+        high = int(last) if last is not None else 0
+        after = max(0, high - MIRROR_ID_OVERLAP) if last is not None else 0
+        total = 0
+        while True:
+            keys = supabase_client.table("news_vectors").select(NEWS_KEY_COLUMNS)\
+                .gt("id", after).order("id").limit(MIRROR_PAGE_SIZE).execute().data
+            if not keys: break
+            after = keys[-1]["id"]
+            high = max(high, after)
+            rows = []
+            for chunk in _chunks(self._stale_news_ids(keys), MIRROR_ID_CHUNK):
+                rows.extend(supabase_client.table("news_vectors").select(NEWS_COLUMNS)
+                            .in_("id", chunk).execute().data)
+            self._apply("news_vectors", rows, high)
+            total += len(rows)
+            if len(keys) < MIRROR_PAGE_SIZE: break
+        return total
+
+    def _stale_news_ids(self, keys):
+        """Ids in an id-ordered page of key rows that are missing or differ locally."""
+        local = {r[0]: r[1:] for r in self.conn.execute(
+            "SELECT id, url, headline, published_at FROM news_vectors WHERE id BETWEEN ? AND ?",
+            (keys[0]["id"], keys[-1]["id"])
+        )}
+        return [k["id"] for k in keys
+                if local.get(k["id"]) != (k.get("url"), k.get("headline"), k.get("published_at") or "")]
+
+    def _sync_knowledge_graph(self, supabase_client):
+        last = self.watermark("knowledge_graph")
+        high = self.conn.execute("SELECT MAX(id) FROM news_vectors").fetchone()[0] or 0
+        total = 0
+
+        if last is None:
+            # First sync: the whole table, paged in primary-key order.
+            def query():
+                q = supabase_client.table("knowledge_graph").select(EDGE_COLUMNS)
+                for column in EDGE_KEY: q = q.order(column)
+                return q
+            for rows in _pages(query):
+                self._apply("knowledge_graph", rows)
+                total += len(rows)
+            self._apply("knowledge_graph", [], high)
+            return total
+
+        ids = [str(r[0]) for r in self.conn.execute(
+            "SELECT id FROM news_vectors WHERE id > ? ORDER BY id", (int(last) - MIRROR_ID_OVERLAP,)
+        )]
+        for chunk in _chunks(ids, MIRROR_ID_CHUNK):
+            def query():
+                q = supabase_client.table("knowledge_graph").select(EDGE_COLUMNS).in_("source_node", chunk)
+                for column in EDGE_KEY: q = q.order(column)
+                return q
+            for rows in _pages(query):
+                self._apply("knowledge_graph", rows)
+                total += len(rows)
+        self._apply("knowledge_graph", [], max(high, int(last)))
+        return total
+
+    def _apply(self, table, rows, watermark=None):
+        local_rows = [_to_local_row(table, r) for r in rows]
+        if table == "knowledge_graph":
+            local_rows += [(t, s, e, w) for s, t, e, w in local_rows if e == SIMILAR_EDGE_TYPE]
+        # Rows and watermark commit together, so an interrupted sync resumes cleanly.
+        with self._lock, self.conn:
+            self.conn.executemany(_UPSERT_SQL[table], local_rows)
+            if watermark is not None:
+                self._set_watermark(table, watermark)
+
+    # --- READS ---
+
+    def daily_market_vectors(self, target_date):
+        """
+        Local stand-in for the get_daily_market_vectors RPC: one row per ticker
+        mentioned that day, with the mean embedding of its articles and the
+        latest headline. Returns dicts shaped like the RPC rows.
+        """
+        rows = self.conn.execute("""
+            SELECT e.target_node, n.headline, n.embedding
+            FROM news_vectors n
+            JOIN knowledge_graph e ON e.source_node = CAST(n.id AS TEXT) AND e.edge_type = 'MENTIONS'
+            WHERE n.published_date = ?
+            ORDER BY e.target_node, n.published_at
+        """, (target_date,)).fetchall()
+        if not rows: return []
+
+        tickers = [r[0] for r in rows]
+        vectors = np.stack([np.frombuffer(r[2], dtype=np.float32) for r in rows])
+        starts = np.flatnonzero([i == 0 or tickers[i] != tickers[i - 1] for i in range(len(tickers))])
+        counts = np.diff(np.append(starts, len(tickers)))
+        means = np.add.reduceat(vectors, starts, axis=0) / counts[:, None]
+
+        return [{
+            "ticker": tickers[s],
+            "vector": means[i],
+            "headline": rows[s + c - 1][1]
+        } for i, (s, c) in enumerate(zip(starts, counts))]
+
+    def recent_vectors(self, limit):
+        """(ids, float32 matrix) of the `limit` latest articles, oldest first, like similarity.load_recent_vectors."""
+        rows = self.conn.execute(
+            "SELECT id, embedding FROM news_vectors ORDER BY published_at DESC LIMIT ?", (limit,)
+        ).fetchall()[::-1]
+        if not rows: return [], np.empty((0, 0), dtype=np.float32)
+        return [r[0] for r in rows], np.stack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+
+    def edges(self, edge_type="MENTIONS"):
+        rows = self.conn.execute(
+            "SELECT source_node, target_node, weight FROM knowledge_graph WHERE edge_type = ?", (edge_type,)
+        ).fetchall()
+        return [{"source_node": s, "target_node": t, "weight": w if w is not None else 1} for s, t, w in rows]
+
+    def close_rows(self, since):
+        rows = self.conn.execute(
+            "SELECT ticker, date, close FROM stocks_ohlc WHERE date >= ? AND close IS NOT NULL ORDER BY date, ticker",
+            (since,)
+        ).fetchall()
+        return [{"ticker": t, "date": d, "close": c} for t, d, c in rows]
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_mirror(sync=MIRROR_AUTO_SYNC):
+    """Process-wide mirror; synced incrementally on first use when `sync` is set."""
+    global _mirror
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = AnalyticsMirror()
+            if sync:
+                from clients import get_supabase
+                t0 = time.perf_counter()
+                _mirror.sync(get_supabase())
+                print(f"   > 🪞 Mirror ready in {time.perf_counter() - t0:.2f}s ({_mirror.path})")
+        return _mirror
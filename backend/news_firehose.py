@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import argparse
+import functools
+from datetime import datetime, timedelta, timezone
+import config  # noqa: F401
+from rate_limiter import polygon_get
+from metrics import run_metrics
+
+# --- NEWS FIREHOSE ---
+# Pages the market-wide /v2/reference/news feed forward from a saved
+# `published_utc` high-water mark instead of querying once per ticker.
+# One multi-ticker story is fetched once, news-heavy names are not capped at
+# NEWS_LOOKBACK_LIMIT, and request volume follows actual news volume rather
+# than universe size. Articles are filtered to the ticker universe locally.
+
+POLYGON_BASE_URL = "https://api.polygon.io"
+NEWS_CURSOR_PATH = os.getenv("NEWS_CURSOR_PATH", "state/news_cursor.json")
+NEWS_FIREHOSE_PAGE_SIZE = 1000
+NEWS_FIREHOSE_MAX_PAGES = int(os.getenv("NEWS_FIREHOSE_MAX_PAGES", "50"))
+NEWS_FIREHOSE_BOOTSTRAP_HOURS = int(os.getenv("NEWS_FIREHOSE_BOOTSTRAP_HOURS", "24"))
+NEWS_POLL_INTERVAL = int(os.getenv("NEWS_POLL_INTERVAL", "300"))
+
+
+def load_cursor(path=NEWS_CURSOR_PATH):
+    """Returns {'published_utc': iso, 'ids_at_cursor': [...]}; bootstraps from a lookback window."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        start = datetime.now(timezone.utc) - timedelta(hours=NEWS_FIREHOSE_BOOTSTRAP_HOURS)
+        return {"published_utc": start.strftime('%Y-%m-%dT%H:%M:%SZ'), "ids_at_cursor": []}
+
+
+def save_cursor(cursor, path=NEWS_CURSOR_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cursor, f)
+    os.replace(tmp_path, path)
+
+
+def hold_cursor(next_cursor, failed_articles):
+    """
+    Pulls the cursor back to the earliest article that was not stored, so the
+    next poll re-reads it (everything after it is re-upserted, which is
+    idempotent) instead of skipping it for good.
+    """
+    published = [a["published_utc"] for a in failed_articles if a.get("published_utc")]
+    if not published: return next_cursor
+    earliest = min(published)
+    if earliest > next_cursor["published_utc"]: return next_cursor
+    if earliest == next_cursor["published_utc"]:
+        # Failures at the high-water mark itself: just stop marking them as seen.
+        failed_ids = {a.get("id") for a in failed_articles}
+        return {"published_utc": earliest,
+                "ids_at_cursor": [i for i in next_cursor["ids_at_cursor"] if i not in failed_ids]}
+    print(f"   > ⏸️ Holding news cursor at {earliest} for {len(failed_articles)} unstored stories.")
+    return {"published_utc": earliest, "ids_at_cursor": []}
+
+
+def fetch_news_since(http, api_key, cursor, universe, max_pages=NEWS_FIREHOSE_MAX_PAGES):
+    """
+    Pages ascending by published_utc from the cursor (inclusive, skipping ids
+    already seen at exactly that timestamp). Returns (articles, next_cursor);
+    the caller saves next_cursor (via hold_cursor) only after the articles are persisted.
+    """
+    universe = set(universe)
+    seen_at_cursor = set(cursor.get("ids_at_cursor", []))
+    high_water = cursor["published_utc"]
+    ids_at_high_water = set(seen_at_cursor)
+
+    next_url = (
+        f"{POLYGON_BASE_URL}/v2/reference/news?published_utc.gte={high_water}"
+        f"&order=asc&sort=published_utc&limit={NEWS_FIREHOSE_PAGE_SIZE}&apiKey={api_key}"
+    )
+    articles = {}
+    fetched = 0
+    pages = 0
+
+    while next_url and pages < max_pages:
+        resp = polygon_get(http, next_url, "news", timeout=20)
+        if resp.status_code != 200:
+            print(f"   > ❌ Firehose Error {resp.status_code}")
+            break
+        data = resp.json()
+        results = data.get("results", [])
+        pages += 1
+        fetched += len(results)
+
+        for art in results:
+            published = art.get("published_utc")
+            if not published: continue
+            if published == cursor["published_utc"] and art.get("id") in seen_at_cursor:
+                continue
+
+            # Advance the high-water mark over everything seen, relevant or not.
+            if published > high_water:
+                high_water = published
+                ids_at_high_water = set()
+            if published == high_water:
+                ids_at_high_water.add(art.get("id"))
+
+            if art.get("article_url") and universe.intersection(art.get("tickers", [])):
+                articles[art["article_url"]] = art
+
+        next_url = data.get("next_url")
+        if next_url: next_url += f"&apiKey={api_key}"
+
+    run_metrics.inc("firehose_articles_fetched_total", fetched)
+    run_metrics.inc("firehose_articles_relevant_total", len(articles))
+    if next_url:
+        print(f"   > ⚠️ Firehose stopped at {max_pages} pages; the rest is picked up next poll.")
+
+    next_cursor = {"published_utc": high_water, "ids_at_cursor": sorted(i for i in ids_at_high_water if i)}
+    return list(articles.values()), next_cursor
+
+
+def run_poller(handle_articles, http, api_key, universe, interval=NEWS_POLL_INTERVAL, once=False):
+    """
+    Long-lived loop: fetch from the cursor, hand articles off, then advance the
+    cursor. handle_articles returns the articles it failed to store.
+    """
+    while True:
+        cycle_start = time.time()
+        cursor = load_cursor()
+        try:
+            articles, next_cursor = fetch_news_since(http, api_key, cursor, universe)
+            print(f"📰 Firehose: {len(articles)} new relevant stories since {cursor['published_utc']}")
+            failed = handle_articles(articles) if articles else []
+            save_cursor(hold_cursor(next_cursor, failed or []))
+        except Exception as e:
+            # Cursor is left untouched so the same window is retried next cycle.
+            print(f" ❌ Firehose cycle failed: {e}")
+
+        # Refresh the report every cycle so the textfile collector sees a live poller.
+        run_metrics.write_report()
+        if once: return
+        time.sleep(max(0, interval - (time.time() - cycle_start)))
+
+
+def run_ingest_poller(interval=NEWS_POLL_INTERVAL, once=False):
+    """Wires the poller to ingest's embed/store path."""
+    import ingest
+    from http_client import get_http_client
+
+    # The poller runs for hours, so downloading the similarity seed once pays off.
+    run_poller(
+        functools.partial(ingest.embed_and_store_articles, warm_similarity=True),
+        get_http_client(ingest.MAX_WORKERS),
+        ingest.MASSIVE_KEY,
+        ingest.TICKER_UNIVERSE,
+        interval=interval,
+        once=once
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Poll the market-wide news feed into news_vectors.")
+    parser.add_argument("--interval", type=int, default=NEWS_POLL_INTERVAL, help="Seconds between polls.")
+    parser.add_argument("--once", action="store_true", help="Run a single poll and exit.")
+    args = parser.parse_args()
+
+    run_metrics.begin("news_firehose")
+    run_ingest_poller(interval=args.interval, once=args.once)
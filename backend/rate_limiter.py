@@ -0,0 +1,186 @@
+import os
+import time
+import threading
+from email.utils import parsedate_to_datetime
+import config  # noqa: F401
+from metrics import run_metrics
+
+# --- ADAPTIVE RATE LIMITER ---
+# Process-wide token bucket + AIMD concurrency controller for Polygon traffic.
+# Every worker thread in every script goes through the same limiter, so a 429
+# seen by one thread slows the whole process down instead of each pool
+# hammering the API on its own. Rate and concurrency creep back up on success.
+
+POLYGON_RATE_PER_SEC = float(os.getenv("POLYGON_RATE_PER_SEC", "20"))
+POLYGON_MAX_RATE_PER_SEC = float(os.getenv("POLYGON_MAX_RATE_PER_SEC", "100"))
+POLYGON_MIN_RATE_PER_SEC = float(os.getenv("POLYGON_MIN_RATE_PER_SEC", "0.1"))
+POLYGON_MAX_CONCURRENCY = int(os.getenv("POLYGON_MAX_CONCURRENCY", "20"))
+POLYGON_MAX_ATTEMPTS = int(os.getenv("POLYGON_MAX_ATTEMPTS", "8"))
+
+DEFAULT_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+DECREASE_COOLDOWN_SECONDS = 1.0  # one multiplicative decrease per burst of 429s
+RATE_INCREASE_STEP = 0.05
+
+
+class RateLimitExhausted(Exception):
+    pass
+
+
+def _parse_retry_after(value):
+    if not value: return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def _parse_reset(value):
+    """X-RateLimit-Reset is either an epoch timestamp or seconds-until-reset."""
+    if not value: return None
+    try:
+        reset = float(value)
+    except ValueError:
+        return None
+    if reset > 1e12: reset /= 1000.0  # epoch millis
+    if reset > 1e9: return max(0.0, reset - time.time())
+    return max(0.0, reset)
+
+
+class AdaptiveRateLimiter:
+    def __init__(self, rate, max_rate, min_rate, max_concurrency, min_concurrency=1):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.limit = float(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+
+        self._cond = threading.Condition()
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._backoff = DEFAULT_BACKOFF_SECONDS
+        self._throttled_since_success = False
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            rate=POLYGON_RATE_PER_SEC,
+            max_rate=POLYGON_MAX_RATE_PER_SEC,
+            min_rate=POLYGON_MIN_RATE_PER_SEC,
+            max_concurrency=POLYGON_MAX_CONCURRENCY
+        )
+
+    def _refill(self, now):
+        burst = max(1.0, self.rate)
+        self._tokens = min(burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """Blocks until a token and a concurrency slot are both available."""
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    self._cond.wait(self._paused_until - now)
+                    continue
+                if self._in_flight >= int(self.limit):
+                    self._cond.wait()
+                    continue
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    self._in_flight += 1
+                    break
+                self._cond.wait((1.0 - self._tokens) / self.rate)
+        waited = time.monotonic() - start
+        if waited > 0.001:
+            run_metrics.inc("rate_limit_wait_seconds_total", round(waited, 4))
+
+    def release(self, outcome="ok", headers=None):
+        """outcome is 'ok', 'throttled' (429) or 'error' (network failure, no rate change)."""
+        with self._cond:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if outcome == "throttled":
+                self._on_throttle(now, headers)
+            elif outcome == "ok":
+                self._on_success()
+            if headers:
+                self._apply_quota_headers(now, headers)
+            self._cond.notify_all()
+
+    def _on_success(self):
+        # Additive increase: +1 concurrency slot per `limit` successes, small rate bump.
+        self.limit = min(self.max_concurrency, self.limit + 1.0 / max(self.limit, 1.0))
+        self.rate = min(self.max_rate, self.rate + RATE_INCREASE_STEP)
+        self._backoff = DEFAULT_BACKOFF_SECONDS
+        self._throttled_since_success = False
+
+    def _on_throttle(self, now, headers):
+        retry_after = _parse_retry_after((headers or {}).get("Retry-After"))
+        if now - self._last_decrease >= DECREASE_COOLDOWN_SECONDS:
+            # Multiplicative decrease and one backoff step, once per burst of 429s;
+            # the rest of the burst only extends the pause to the current backoff.
+            self.limit = max(self.min_concurrency, self.limit / 2.0)
+            self.rate = max(self.min_rate, self.rate / 2.0)
+            if self._throttled_since_success:
+                self._backoff = min(MAX_BACKOFF_SECONDS, self._backoff * 2.0)
+            self._throttled_since_success = True
+            self._last_decrease = now
+            run_metrics.inc("rate_limit_decreases_total")
+        pause = retry_after if retry_after is not None else self._backoff
+        self._tokens = 0.0
+        self._paused_until = max(self._paused_until, now + pause)
+
+    def _apply_quota_headers(self, now, headers):
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_in = _parse_reset(headers.get("X-RateLimit-Reset"))
+        if remaining is None or reset_in is None: return
+        try:
+            remaining = float(remaining)
+        except ValueError:
+            return
+        if remaining <= 0:
+            self._paused_until = max(self._paused_until, now + reset_in)
+            self._tokens = 0.0
+        else:
+            # Spread the remaining quota evenly over the window.
+            sustainable = remaining / max(reset_in, 1.0)
+            self.rate = max(self.min_rate, min(self.max_rate, sustainable))
+
+
+polygon_limiter = AdaptiveRateLimiter.from_env()
+
+
+def polygon_get(http, url, endpoint, timeout=10, max_attempts=POLYGON_MAX_ATTEMPTS):
+    """
+    GETs a Polygon URL through the shared limiter. 429s are retried here
+    (after the limiter's shared pause) so callers only ever see a final
+    non-429 response. Raises RateLimitExhausted if the API never lets us in.
+    """
+    for attempt in range(1, max_attempts + 1):
+        polygon_limiter.acquire()
+        t0 = time.perf_counter()
+        try:
+            resp = http.get(url, timeout=timeout)
+        except Exception:
+            polygon_limiter.release("error")
+            raise
+        run_metrics.observe_http(endpoint, resp.status_code, time.perf_counter() - t0)
+
+        if resp.status_code != 429:
+            polygon_limiter.release("ok", resp.headers)
+            return resp
+        polygon_limiter.release("throttled", resp.headers)
+        run_metrics.inc("retries_total", fn=f"polygon_get:{endpoint}")
+
+    run_metrics.inc("rate_limit_exhausted_total", endpoint=endpoint)
+    raise RateLimitExhausted(f"{endpoint}: still rate limited after {max_attempts} attempts")
@@ -0,0 +1,168 @@
+import os
+import json
+import threading
+import numpy as np
+from metrics import run_metrics
+from batch_writer import AdaptiveBatchWriter
+
+# --- SEMANTIC SIMILARITY EDGES ---
+# Precomputes article-to-article SIMILAR_TO edges (weight = cosine score) as
+# news is ingested, so readers get ready-made neighbourhoods instead of
+# running a vector search per article at query time. Each new batch is scored
+# against itself plus a rolling in-memory window of recent vectors with a
+# blocked matrix multiply and an argpartition top-k.
+
+SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", "10"))
+SIMILARITY_MIN_SCORE = float(os.getenv("SIMILARITY_MIN_SCORE", "0.75"))
+SIMILARITY_WINDOW_SIZE = int(os.getenv("SIMILARITY_WINDOW_SIZE", "5000"))
+SIMILARITY_SEED_SIZE = int(os.getenv("SIMILARITY_SEED_SIZE", "2000"))
+SIMILARITY_BATCH_SIZE = 512
+SIMILARITY_BLOCK_SIZE = 1024
+SIMILAR_EDGE_TYPE = "SIMILAR_TO"
+
+
+def _normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_neighbors(query_ids, queries, corpus_ids, corpus, k=SIMILARITY_TOP_K,
+                    min_score=SIMILARITY_MIN_SCORE, block_size=SIMILARITY_BLOCK_SIZE):
+    """
+    Yields (query_id, neighbor_id, score) for each query's top-k corpus rows by
+    cosine similarity, excluding itself and anything under min_score.
+    Inputs must already be L2-normalized. Peak memory is block_size x len(corpus).
+    """
+    n_corpus = len(corpus_ids)
+    if n_corpus == 0 or len(query_ids) == 0: return
+    kk = min(k, n_corpus)
+
+    for start in range(0, len(query_ids), block_size):
+        block_ids = query_ids[start:start + block_size]
+        sims = queries[start:start + block_size] @ corpus.T
+        sims[block_ids[:, None] == corpus_ids[None, :]] = -np.inf
+
+        top = np.argpartition(-sims, kk - 1, axis=1)[:, :kk]
+        top_scores = np.take_along_axis(sims, top, axis=1)
+        rows, cols = np.nonzero(top_scores >= min_score)
+        for r, c in zip(rows, cols):
+            yield block_ids[r], corpus_ids[top[r, c]], float(top_scores[r, c])
+
+
+class SimilarityLinker:
+    """
+    Thread-safe sink for freshly stored (article_id, embedding) pairs. Scores
+    pending articles every SIMILARITY_BATCH_SIZE rows (and on flush) and
+    writes SIMILAR_TO edges in both directions through an AdaptiveBatchWriter.
+    The window survives flushes, so a long-lived poller keeps its history.
+    """
+    def __init__(self, writer, k=SIMILARITY_TOP_K, min_score=SIMILARITY_MIN_SCORE,
+                 window_size=SIMILARITY_WINDOW_SIZE, phase="embed.similarity"):
+        self.k = k
+        self.min_score = min_score
+        self.window_size = window_size
+        self.window_ids = np.empty(0, dtype=np.int64)
+        self.window = None
+        self.edges_found = 0
+        # A sub-stage of whichever phase feeds it, so the phase table does not count it twice.
+        self.phase = phase
+
+        self._pending_ids = []
+        self._pending_vectors = []
+        self._lock = threading.Lock()
+        self._compute_lock = threading.Lock()
+        self.writer = writer
+        self.edge_writer = self._new_edge_writer()
+
+    def _new_edge_writer(self):
+        return AdaptiveBatchWriter(self.writer, "knowledge_graph", on_conflict="source_node,target_node,edge_type")
+
+    def seed(self, ids, vectors):
+        """Pre-loads the window (e.g. with recent news_vectors) without emitting edges."""
+        if len(ids) == 0: return
+        self._push_window(np.asarray(ids, dtype=np.int64), _normalize_rows(vectors))
+
+    def add(self, ids, vectors):
+        batch = None
+        with self._lock:
+            self._pending_ids.extend(ids)
+            self._pending_vectors.extend(vectors)
+            if len(self._pending_ids) >= SIMILARITY_BATCH_SIZE:
+                batch = self._take_pending()
+        if batch:
+            self._link(*batch)
+
+    def flush(self):
+        """Scores whatever is pending and waits for the edges to land. Returns edges written."""
+        with self._lock:
+            batch = self._take_pending()
+        if batch:
+            self._link(*batch)
+        edge_writer, self.edge_writer = self.edge_writer, self._new_edge_writer()
+        edge_writer.close()
+        return edge_writer.rows_written
+
+    # --- INTERNALS ---
+
+    def _take_pending(self):
+        if not self._pending_ids: return None
+        batch = (self._pending_ids, self._pending_vectors)
+        self._pending_ids, self._pending_vectors = [], []
+        return batch
+
+    def _push_window(self, ids, vectors):
+        if self.window is None:
+            self.window_ids, self.window = ids, vectors
+        else:
+            # Re-upserted articles come back with the same id; keep only the newest copy.
+            keep = ~np.isin(self.window_ids, ids)
+            self.window_ids = np.concatenate([self.window_ids[keep], ids])
+            self.window = np.vstack([self.window[keep], vectors])
+        if len(self.window_ids) > self.window_size:
+            self.window_ids = self.window_ids[-self.window_size:]
+            self.window = self.window[-self.window_size:]
+
+    def _link(self, ids, vectors):
+        with self._compute_lock, run_metrics.phase(self.phase):
+            ids = np.asarray(ids, dtype=np.int64)
+            vectors = _normalize_rows(vectors)
+            # The batch joins the window first so intra-batch pairs are scored too.
+            self._push_window(ids, vectors)
+
+            edges = {}
+            for src, dst, score in top_k_neighbors(ids, vectors, self.window_ids, self.window,
+                                                   k=self.k, min_score=self.min_score):
+                for a, b in ((src, dst), (dst, src)):
+                    key = (str(a), str(b))
+                    if score > edges.get(key, -1.0):
+                        edges[key] = score
+
+        self.edges_found += len(edges)
+        run_metrics.inc("similarity_edges_total", len(edges))
+        self.edge_writer.extend({
+            "source_node": src,
+            "target_node": dst,
+            "edge_type": SIMILAR_EDGE_TYPE,
+            "weight": round(score, 4)
+        } for (src, dst), score in edges.items())
+
+
+def load_recent_vectors(supabase_client, limit=SIMILARITY_SEED_SIZE, page_size=1000):
+    """Fetches the most recent news_vectors (id, embedding) to warm the window."""
+    ids, vectors = [], []
+    for offset in range(0, limit, page_size):
+        resp = supabase_client.table("news_vectors")\
+            .select("id, embedding")\
+            .order("published_at", desc=True)\
+            .range(offset, min(offset + page_size, limit) - 1).execute()
+        if not resp.data: break
+        for item in resp.data:
+            vec = item['embedding']
+            if isinstance(vec, str): vec = json.loads(vec)
+            ids.append(item['id'])
+            vectors.append(vec)
+        if len(resp.data) < page_size: break
+    # Oldest first, so trimming the window drops the stalest rows.
+    return ids[::-1], np.asarray(vectors[::-1], dtype=np.float32)
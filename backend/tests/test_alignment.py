@@ -0,0 +1,43 @@
+import numpy as np
+
+from alignment import FrameAligner, weighted_procrustes
+
+
+def rotation(theta):
+    return np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+
+
+def test_procrustes_recovers_rotation_and_translation():
+    rng = np.random.default_rng(0)
+    source = rng.normal(size=(30, 2))
+    target = (source - source.mean(axis=0)) @ rotation(1.1) + np.array([5.0, -3.0])
+    weights = rng.uniform(0.5, 2.0, size=30)
+
+    R, c_src, c_tgt = weighted_procrustes(source, target, weights)
+    np.testing.assert_allclose((target - c_tgt) @ R + c_src, source, atol=1e-9)
+    assert np.isclose(np.linalg.det(R), 1.0)
+
+
+def test_procrustes_rejects_reflections():
+    rng = np.random.default_rng(1)
+    source = rng.normal(size=(30, 2))
+    mirrored = source * np.array([-1.0, 1.0])
+
+    R, _, _ = weighted_procrustes(source, mirrored, np.ones(30))
+    assert np.isclose(np.linalg.det(R), 1.0)
+    np.testing.assert_allclose(R @ R.T, np.eye(2), atol=1e-9)
+
+
+def test_aligner_round_trips_a_rotated_frame():
+    rng = np.random.default_rng(2)
+    tickers = [f"T{i}" for i in range(20)]
+    day_one = rng.normal(size=(20, 2))
+
+    aligner = FrameAligner(anchor_tickers=["T0", "T1"], reference_frames=1)
+    np.testing.assert_allclose(aligner.align(tickers, day_one), day_one)
+
+    # Same map, rotated and shifted, with tickers in a different order.
+    order = rng.permutation(20)
+    day_two = day_one[order] @ rotation(-0.7) + np.array([10.0, 4.0])
+    aligned = aligner.align([tickers[i] for i in order], day_two)
+    np.testing.assert_allclose(aligned, day_one[order], atol=1e-9)
@@ -0,0 +1,57 @@
+from dedup import DedupIndex, dedupe_articles, duplicate_edges, DUPLICATE_EDGE_TYPE
+
+WIRE = ("Acme Corp shares jump after quarterly revenue beats estimates",
+        "Acme Corp reported third quarter revenue of 4.2 billion dollars, ahead of analyst estimates, "
+        "and raised its full year guidance on strong cloud demand.")
+
+
+def story(url, tickers, title=WIRE[0], description=WIRE[1], published="2025-10-01T10:00:00Z"):
+    return {"article_url": url, "title": title, "description": description,
+            "tickers": list(tickers), "published_utc": published}
+
+
+def test_copies_within_a_batch_collapse():
+    canonicals = dedupe_articles([story("a", ["ACME"]), story("b", ["ACME", "XYZ"], published="2025-10-01T11:00:00Z")])
+    assert len(canonicals) == 1
+    assert canonicals[0]["article_url"] == "a"
+    assert canonicals[0]["tickers"] == ["ACME", "XYZ"]
+    assert canonicals[0]["duplicate_urls"] == ["b"]
+
+
+def test_copy_in_a_later_batch_links_to_the_stored_canonical():
+    index = DedupIndex()
+    first = dedupe_articles([story("a", ["ACME"])], index=index)
+    assert "duplicate_of" not in first[0]
+
+    # Not matched until its vector is stored and the id is known.
+    assert "duplicate_of" not in dedupe_articles([story("b", ["ACME"])], index=index)[0]
+    index.resolve("a", 42)
+
+    later = dedupe_articles([story("c", ["XYZ"]), story("d", ["ACME"], title="Unrelated", description="Something else entirely happened today.")],
+                            index=index)
+    copies = [a for a in later if "duplicate_of" in a]
+    assert [(a["article_url"], a["duplicate_of"]) for a in copies] == [("c", 42)]
+
+    edges = duplicate_edges(copies[0], 42)
+    assert {(e["source_node"], e["target_node"], e["edge_type"]) for e in edges} == {
+        ("42", "XYZ", "MENTIONS"), ("42", "c", DUPLICATE_EDGE_TYPE)}
+
+
+def test_same_url_again_is_not_a_copy_of_itself():
+    index = DedupIndex()
+    dedupe_articles([story("a", ["ACME"])], index=index)
+    index.resolve("a", 42)
+    assert "duplicate_of" not in dedupe_articles([story("a", ["ACME"])], index=index)[0]
+
+
+def url_for(n):
+    return f"https://news.example/{n}"
+
+
+def test_index_forgets_the_oldest_entries():
+    index = DedupIndex(window=1)
+    dedupe_articles([story(url_for(1), ["ACME"])], index=index)
+    index.resolve(url_for(1), 1)
+    dedupe_articles([story(url_for(2), ["XYZ"], title="Other", description="A different story about other things.")], index=index)
+    assert len(index) == 1
+    assert "duplicate_of" not in dedupe_articles([story(url_for(3), ["ACME"])], index=index)[0]
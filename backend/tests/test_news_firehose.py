@@ -0,0 +1,80 @@
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+import news_firehose
+from news_firehose import fetch_news_since, hold_cursor
+
+UNIVERSE = ["AAPL", "MSFT"]
+
+
+class FakeResponse:
+    def __init__(self, results):
+        self.status_code = 200
+        self._body = {"results": results}
+
+    def json(self):
+        return self._body
+
+
+def story(story_id, published_utc, tickers=("AAPL",)):
+    return {"id": story_id, "published_utc": published_utc,
+            "article_url": f"https://news.example/{story_id}", "tickers": list(tickers)}
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    """A news feed served by a stubbed polygon_get, honouring published_utc.gte and asc order."""
+    stories = []
+
+    def fake_polygon_get(http, url, endpoint, timeout=None):
+        since = parse_qs(urlparse(url).query)["published_utc.gte"][0]
+        return FakeResponse(sorted((s for s in stories if s["published_utc"] >= since),
+                                   key=lambda s: s["published_utc"]))
+
+    monkeypatch.setattr(news_firehose, "polygon_get", fake_polygon_get)
+    return stories
+
+
+def poll(cursor):
+    return fetch_news_since(None, "key", cursor, UNIVERSE)
+
+
+def ids(articles):
+    return sorted(a["id"] for a in articles)
+
+
+def test_stored_stories_are_not_fetched_again(feed):
+    feed += [story("a", "2025-10-01T10:00:00Z"), story("b", "2025-10-01T11:00:00Z")]
+    articles, next_cursor = poll({"published_utc": "2025-10-01T09:00:00Z", "ids_at_cursor": []})
+    assert ids(articles) == ["a", "b"]
+
+    articles, _ = poll(hold_cursor(next_cursor, []))
+    assert articles == []
+
+
+def test_failure_at_the_high_water_mark_is_fetched_again(feed):
+    feed += [story("a", "2025-10-01T10:00:00Z"),
+             story("b", "2025-10-01T11:00:00Z"), story("c", "2025-10-01T11:00:00Z")]
+    articles, next_cursor = poll({"published_utc": "2025-10-01T09:00:00Z", "ids_at_cursor": []})
+    assert next_cursor == {"published_utc": "2025-10-01T11:00:00Z", "ids_at_cursor": ["b", "c"]}
+
+    failed = [a for a in articles if a["id"] == "b"]
+    held = hold_cursor(next_cursor, failed)
+    assert held == {"published_utc": "2025-10-01T11:00:00Z", "ids_at_cursor": ["c"]}
+
+    articles, _ = poll(held)
+    assert ids(articles) == ["b"]
+
+
+def test_earlier_failure_holds_the_cursor_at_that_story(feed):
+    feed += [story("a", "2025-10-01T10:00:00Z"), story("b", "2025-10-01T11:00:00Z")]
+    articles, next_cursor = poll({"published_utc": "2025-10-01T09:00:00Z", "ids_at_cursor": []})
+
+    failed = [a for a in articles if a["id"] == "a"]
+    held = hold_cursor(next_cursor, failed)
+    assert held == {"published_utc": "2025-10-01T10:00:00Z", "ids_at_cursor": []}
+
+    # Everything from the failed story on is re-read; later stories are re-upserted.
+    articles, _ = poll(held)
+    assert ids(articles) == ["a", "b"]
@@ -0,0 +1,25 @@
+import time
+
+from rate_limiter import AdaptiveRateLimiter, DEFAULT_BACKOFF_SECONDS
+
+
+def throttle_burst(limiter, size):
+    limiter._in_flight = size
+    start = time.monotonic()
+    for _ in range(size):
+        limiter.release("throttled")
+    return limiter._paused_until - start
+
+
+def test_one_burst_of_429s_costs_one_backoff_step():
+    limiter = AdaptiveRateLimiter(rate=20, max_rate=100, min_rate=0.1, max_concurrency=20)
+
+    pause = throttle_burst(limiter, 10)
+    assert pause < DEFAULT_BACKOFF_SECONDS + 0.1
+    assert limiter.limit == 10
+
+    # The next burst, after the cooldown, backs off one step further.
+    limiter._last_decrease -= 2
+    limiter._paused_until = 0.0
+    pause = throttle_burst(limiter, 10)
+    assert 2 * DEFAULT_BACKOFF_SECONDS - 0.1 < pause < 2 * DEFAULT_BACKOFF_SECONDS + 0.1